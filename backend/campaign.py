@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+import control as controls
+import database
+import jobs
+import logic
+from database import db
+
+logger = logging.getLogger("backend.campaign")
+
+# sessions against the same model that run at once - a local model serves one prompt at a time anyway
+MODEL_CONCURRENCY = int(os.environ.get("AGENTXPLOIT_CAMPAIGN_MODEL_CONCURRENCY", "1"))
+
+
+class CampaignCreated(BaseModel):
+    campaign_id: str
+    session_ids: List[str]
+
+
+class CampaignCell(BaseModel):
+    """One (model, criteria) session of a campaign"""
+    session_id: str
+    model: str
+    success_criteria: str
+    status: str
+    attempts: int
+    successes: int
+    attempts_to_break: Optional[int] = None   #1-based index of the first successful attempt
+    seconds_to_break: Optional[float] = None
+    elapsed_seconds: Optional[float] = None
+    avg_target_ms: Optional[float] = None     #mean reply time of the target model
+
+
+class CampaignResults(BaseModel):
+    campaign_id: str
+    status: str
+    models: List[str]
+    criteria: List[str]
+    matrix: List[List[Optional[int]]]  #matrix[model][criteria] = attempts_to_break, None if it held
+    cells: List[CampaignCell]
+
+
+def create_campaign(models: List[str], criteria: List[str], max_attempts: int, mode: str = "single",
+                    per_model_concurrency: int = MODEL_CONCURRENCY) -> CampaignCreated:
+    """Saves the campaign and one session per (model, criteria) pair."""
+    if not models or not criteria:
+        raise ValueError("A campaign needs at least one model and one success criteria")
+    if mode not in logic.MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    models = list(dict.fromkeys(models))  #drop repeats, keep order
+    criteria = list(dict.fromkeys(criteria))
+
+    campaign_id = str(uuid.uuid4())
+    session_ids = []
+    with db() as conn:
+        conn.execute("""
+            INSERT INTO campaigns (campaign_id, models, criteria, max_attempts, mode, per_model_concurrency)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (campaign_id, json.dumps(models), json.dumps(criteria), max_attempts, mode, per_model_concurrency))
+        for model in models:
+            for success_criteria in criteria:
+                session_id = str(uuid.uuid4())
+                conn.execute("""
+                    INSERT INTO sessions (session_id, target_model, success_criteria, max_attempts, mode, campaign_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (session_id, model, success_criteria, max_attempts, mode, campaign_id))
+                session_ids.append(session_id)
+
+    return CampaignCreated(campaign_id=campaign_id, session_ids=session_ids)
+
+
+def _campaign_sessions(campaign_id: str) -> tuple[dict, List[dict]]:
+    with db() as conn:
+        campaign = conn.execute("SELECT * FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone()
+        if not campaign:
+            raise ValueError("Campaign not found")
+        sessions = conn.execute("""
+            SELECT session_id, target_model, success_criteria, max_attempts, mode, status
+            FROM sessions WHERE campaign_id = ? ORDER BY rowid
+        """, (campaign_id,)).fetchall()
+    return dict(campaign), [dict(row) for row in sessions]
+
+
+def _set_campaign_status(campaign_id: str, status: str) -> None:
+    with db() as conn:
+        conn.execute("UPDATE campaigns SET status = ? WHERE campaign_id = ?", (status, campaign_id))
+
+
+def _mark_started(session_id: str) -> None:
+    #queued sessions were created with the campaign; elapsed time counts from when they first get a
+    #slot. A session resumed after a restart has left 'initialized' and keeps its start time
+    with db() as conn:
+        conn.execute("UPDATE sessions SET started_at = CURRENT_TIMESTAMP WHERE session_id = ? AND status = 'initialized'",
+                     (session_id,))
+
+
+class CampaignRunner:
+    """
+    Runs a campaign's sessions, at most `per_model_concurrency` at a time against each model.
+    Sessions for different models run side by side; stop() ends all of them, queued ones included.
+    """
+
+    def __init__(self, campaign_id: str, sessions: List[dict], per_model_concurrency: int):
+        self.campaign_id = campaign_id
+        self.sessions = sessions
+        self.status = "running"
+        self._slots = {model: asyncio.Semaphore(max(1, per_model_concurrency))
+                       for model in {s["target_model"] for s in sessions}}
+        self._started: set[str] = set()
+
+    async def run(self) -> None:
+        try:
+            await asyncio.gather(*(self._run_session(session) for session in self.sessions))
+            if self.status == "running":
+                self.status = "finished"
+        finally:
+            await database.run(_set_campaign_status, self.campaign_id, self.status)
+
+    async def _run_session(self, session: dict) -> None:
+        session_id = session["session_id"]
+        if session["status"] in logic.FINAL_STATUSES:  #already ran before the job was picked up again
+            return
+        async with self._slots[session["target_model"]]:
+            if self.status == "stopped":
+                return
+            self._started.add(session_id)
+            control = controls.register(session_id, logic.set_status)
+            if session["status"] == "paused":  #interrupted while paused - resume it paused
+                control.apply("pause")
+            await database.run(_mark_started, session_id)
+            await logic.run_attack_process(session_id, session["target_model"], session["success_criteria"],
+                                           session["max_attempts"], mode=session["mode"])
+
+    async def stop(self) -> None:
+        if self.status != "running":
+            return
+        self.status = "stopped"
+        for session in self.sessions:
+            session_id = session["session_id"]
+            control = controls.get(session_id)
+            if control is not None:
+                if not control.stopped:
+                    control.apply("stop")
+            elif session_id not in self._started:
+                await logic.set_status(session_id, "finished")  #never got a slot
+
+
+# campaigns running in this process
+_campaigns: dict[str, CampaignRunner] = {}
+
+
+async def start_campaign(campaign_id: str) -> None:
+    """Queues a saved campaign; a worker runs it with run_campaign."""
+    await database.run(jobs.enqueue_campaign, campaign_id)
+
+
+async def run_campaign(campaign_id: str) -> None:
+    """Runs a campaign's sessions in this process until every one has ended."""
+    campaign, sessions = await database.run(_campaign_sessions, campaign_id)
+    if campaign["status"] != "running":  #stopped while it was queued
+        return
+    runner = CampaignRunner(campaign_id, sessions, campaign["per_model_concurrency"])
+    _campaigns[campaign_id] = runner
+    try:
+        await runner.run()
+    finally:
+        _campaigns.pop(campaign_id, None)
+
+
+def campaign_status(campaign_id: str) -> Optional[str]:
+    with db() as conn:
+        row = conn.execute("SELECT status FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone()
+    return row["status"] if row else None
+
+
+def _stop_saved_campaign(campaign_id: str) -> None:
+    #not running in this process - just close out what the DB still shows as open
+    with db() as conn:
+        if not conn.execute("SELECT 1 FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone():
+            raise ValueError("Campaign not found")
+        conn.execute("""
+            UPDATE sessions SET status = 'finished'
+            WHERE campaign_id = ? AND status NOT IN ('finished', 'failed', 'success_found')
+        """, (campaign_id,))
+        conn.execute("UPDATE campaigns SET status = 'stopped' WHERE campaign_id = ? AND status = 'running'",
+                     (campaign_id,))
+
+
+async def stop_campaign(campaign_id: str) -> None:
+    """Stops every session of the campaign, running or still queued."""
+    runner = _campaigns.get(campaign_id)
+    if runner is None:
+        await database.run(_stop_saved_campaign, campaign_id)
+        return
+    await runner.stop()
+
+
+def queued_sessions() -> int:
+    """Campaign sessions in this process still waiting for a slot on their model."""
+    return sum(len(runner.sessions) - len(runner._started) for runner in _campaigns.values()
+               if runner.status == "running")
+
+
+def get_campaign_results(campaign_id: str) -> CampaignResults:
+    """The campaign's model x criteria results, read from session_stats and the first successful attempts."""
+    with db() as conn:
+        campaign = conn.execute("SELECT * FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone()
+        if not campaign:
+            raise ValueError("Campaign not found")
+        rows = conn.execute("""
+            SELECT s.session_id, s.target_model, s.success_criteria, s.status,
+                   st.attempts, st.successes,
+                   a.attempt_index + 1 AS attempts_to_break,
+                   (julianday(a.created_at) - julianday(s.started_at)) * 86400 AS seconds_to_break,
+                   (julianday(st.last_activity_at) - julianday(s.started_at)) * 86400 AS elapsed_seconds,
+                   (SELECT AVG(json_extract(m.metadata, '$.total_ms')) FROM messages m
+                    WHERE m.session_id = s.session_id AND m.sender = 'target') AS avg_target_ms
+            FROM sessions s
+            JOIN session_stats st ON st.session_id = s.session_id
+            LEFT JOIN attempts a ON a.id = st.first_success_attempt_id
+            WHERE s.campaign_id = ?
+        """, (campaign_id,)).fetchall()
+
+    models = json.loads(campaign["models"])
+    criteria = json.loads(campaign["criteria"])
+    cells = [CampaignCell(
+        session_id=row["session_id"],
+        model=row["target_model"],
+        success_criteria=row["success_criteria"],
+        status=logic.live_status(row["session_id"], row["status"]),
+        attempts=row["attempts"],
+        successes=row["successes"],
+        attempts_to_break=row["attempts_to_break"],
+        seconds_to_break=row["seconds_to_break"],
+        elapsed_seconds=row["elapsed_seconds"],
+        avg_target_ms=row["avg_target_ms"],
+    ) for row in rows]
+
+    by_pair = {(cell.model, cell.success_criteria): cell for cell in cells}
+    matrix = [[by_pair[(model, c)].attempts_to_break if (model, c) in by_pair else None for c in criteria]
+              for model in models]
+
+    runner = _campaigns.get(campaign_id)
+    return CampaignResults(
+        campaign_id=campaign_id,
+        status=runner.status if runner is not None else campaign["status"],
+        models=models,
+        criteria=criteria,
+        matrix=matrix,
+        cells=sorted(cells, key=lambda cell: (models.index(cell.model), criteria.index(cell.success_criteria))),
+    )
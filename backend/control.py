@@ -0,0 +1,131 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+# in-process pause/resume/stop for running sessions. Attack tasks wait on asyncio events
+# instead of polling the sessions table, and the new status is written to the DB in the background.
+
+
+class SessionStopped(Exception):
+    pass
+
+
+class SessionControl:
+
+    def __init__(self, session_id: str, persist: Callable[[str, str], Awaitable[None]]):
+        self.session_id = session_id
+        self.status = "running"
+        self._persist = persist
+        self._persisting: Optional[asyncio.Task] = None
+        self._running = asyncio.Event()  #cleared while paused
+        self._running.set()
+        self._stopped = asyncio.Event()
+        self.tasks: set[asyncio.Task] = set()  #in-flight attempts, cancelled on stop
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped.is_set()
+
+    async def checkpoint(self) -> None:
+        """Returns right away while running, waits while paused, raises SessionStopped once stopped."""
+        if not self._running.is_set() and not self._stopped.is_set():
+            stop_wait = asyncio.ensure_future(self._stopped.wait())
+            run_wait = asyncio.ensure_future(self._running.wait())
+            try:
+                await asyncio.wait({stop_wait, run_wait}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stop_wait.cancel()
+                run_wait.cancel()
+        if self._stopped.is_set():
+            raise SessionStopped(self.session_id)
+
+    def apply(self, action: str) -> str:
+        """Applies a pause/resume/stop action and returns the new status."""
+        if action == "pause" and self.status == "running":
+            self.status = "paused"
+            self._running.clear()
+
+        elif action == "resume" and self.status == "paused":
+            self.status = "running"
+            self._running.set()
+
+        elif action == "stop" and not self.stopped:
+            #the attack task saves this once it has flushed the transcript
+            self.status = "finished"
+            self._stopped.set()
+            self._running.set()
+            for task in self.tasks:
+                task.cancel()
+            return self.status
+
+        else:
+            raise ValueError("Invalid action for current state")
+
+        self.persist(self.status)
+        return self.status
+
+    def finish(self, status: str) -> None:
+        """Sets the session's final status."""
+        self.status = status
+        self.persist(status)
+
+    def persist(self, status: str) -> None:
+        """Writes the status in the background, after any earlier write for this session."""
+        previous = self._persisting
+
+        async def write():
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await self._persist(self.session_id, status)
+
+        self._persisting = asyncio.create_task(write())
+
+    def sync(self, stored_status: str) -> None:
+        """
+        Applies a pause/resume/stop that another process wrote to the DB. Skipped while a status
+        write from this process is still in flight, since the DB doesn't show it yet.
+        """
+        if self._persisting is not None and not self._persisting.done():
+            return
+        if self.stopped or stored_status == self.status:
+            return
+        action = {"paused": "pause", "running": "resume", "finished": "stop"}.get(stored_status)
+        if action is None:
+            return
+        try:
+            self.apply(action)
+        except ValueError:
+            pass
+
+    async def persisted(self) -> None:
+        """Waits until every status change so far is in the DB."""
+        if self._persisting is not None:
+            await asyncio.gather(self._persisting, return_exceptions=True)
+
+
+_controls: dict[str, SessionControl] = {}
+
+
+def register(session_id: str, persist: Callable[[str, str], Awaitable[None]]) -> SessionControl:
+    control = SessionControl(session_id, persist)
+    _controls[session_id] = control
+    return control
+
+
+def unregister(session_id: str) -> None:
+    _controls.pop(session_id, None)
+
+
+def get(session_id: str) -> Optional[SessionControl]:
+    return _controls.get(session_id)
+
+
+def registered() -> list[SessionControl]:
+    return list(_controls.values())
+
+
+def count_by_status() -> dict[str, int]:
+    """How many registered sessions are running, paused, or stopped but still winding down."""
+    counts: dict[str, int] = {}
+    for control in _controls.values():
+        counts[control.status] = counts.get(control.status, 0) + 1
+    return counts
@@ -0,0 +1,114 @@
+import os
+from typing import List
+
+from pydantic import BaseModel
+
+import database
+from gemini import generate_next_turn, summarize_exchanges
+
+# multi-turn sessions: the attacker and the target share one conversation, rebuilt from the
+# messages table every turn. Only the last HISTORY_TURNS exchanges are sent, so prompt size
+# stays flat however long the session runs; with the "summary" policy the exchanges that
+# leave the window are folded into a running summary the attacker also sees - several at a
+# time, so the summary is rewritten every few turns rather than on every one.
+
+HISTORY_POLICY = os.environ.get("AGENTXPLOIT_HISTORY_POLICY", "window")  #"window" or "summary"
+HISTORY_TURNS = int(os.environ.get("AGENTXPLOIT_HISTORY_TURNS", "4"))      #exchanges kept verbatim
+HISTORY_FOLD = int(os.environ.get("AGENTXPLOIT_HISTORY_FOLD", "0"))        #exchanges summarized at once, 0 = half the window
+HISTORY_MESSAGE_CHARS = int(os.environ.get("AGENTXPLOIT_HISTORY_MESSAGE_CHARS", "2000"))  #longer messages are cut
+
+
+class Turn(BaseModel):
+    """The attacker's next message and what it was built from"""
+    prompt: str
+    history: List[dict]  #earlier messages as Ollama chat messages, oldest first
+    metadata: dict  #per-turn accounting, stored with the attacker message
+
+
+def load_exchanges(session_id: str, limit: int) -> List[tuple[int, str, str]]:
+    """The session's last `limit` (attacker message id, attacker, target) exchanges, oldest first."""
+    with database.db() as conn:
+        rows = conn.execute("""
+            SELECT id, sender, content FROM messages
+            WHERE session_id = ? AND sender IN ('attacker', 'target')
+            ORDER BY id DESC LIMIT ?
+        """, (session_id, limit * 2 + 1)).fetchall()
+
+    exchanges = []
+    pending = None
+    for row in reversed(rows):
+        if row["sender"] == "attacker":
+            pending = row
+        elif pending is not None:
+            exchanges.append((pending["id"], pending["content"], row["content"]))
+            pending = None
+    return exchanges[-limit:]
+
+
+def _cut(text: str) -> str:
+    return text if len(text) <= HISTORY_MESSAGE_CHARS else text[:HISTORY_MESSAGE_CHARS] + " [...]"
+
+
+class Conversation:
+
+    def __init__(self, session_id: str, success_criteria: str, policy: str = HISTORY_POLICY,
+                 window: int = HISTORY_TURNS, fold: int = HISTORY_FOLD):
+        if policy not in ("window", "summary"):
+            raise ValueError(f"Unknown history policy: {policy}")
+        self.session_id = session_id
+        self.success_criteria = success_criteria
+        self.policy = policy
+        self.window = max(1, window)
+        self.fold = min(self.window, fold) if fold > 0 else max(1, self.window // 2)
+        self.summary = ""
+        self._summarized_through = 0  #id of the newest attacker message already in the summary
+
+    def checkpoint(self) -> dict:
+        """What restore() needs to carry on after a restart - the history itself is in the DB."""
+        if self.policy != "summary":
+            return {}
+        return {"summary": self.summary, "summarized_through": self._summarized_through}
+
+    def restore(self, state: dict) -> None:
+        self.summary = state.get("summary", "")
+        self._summarized_through = state.get("summarized_through", 0)
+
+    async def next_turn(self, turn: int) -> Turn:
+        """Reads the recent history from the DB and has Gemini write the next attacker message."""
+        exchanges = await database.run(load_exchanges, self.session_id, self.window + 1)
+        summary_tokens = 0
+
+        if self.policy == "window":
+            exchanges = exchanges[-self.window:]
+        else:
+            #the exchanges not in the summary yet are sent verbatim; once there are more than
+            #the window holds, the oldest `fold` of them are summarized in one call
+            exchanges = [e for e in exchanges if e[0] > self._summarized_through]
+            if len(exchanges) > self.window:
+                dropped = exchanges[:max(self.fold, len(exchanges) - self.window)]
+                exchanges = exchanges[len(dropped):]
+                self.summary, tokens = await summarize_exchanges(
+                    self.summary, [(_cut(a), _cut(t)) for _, a, t in dropped])
+                summary_tokens = tokens or 0
+                self._summarized_through = dropped[-1][0]
+
+        recent = [(_cut(attacker), _cut(target)) for _, attacker, target in exchanges]
+        prompt, tokens = await generate_next_turn(self.success_criteria, self.summary, recent)
+        gemini_tokens = (tokens or 0) + summary_tokens
+
+        history = []
+        for attacker, target in recent:
+            history.append({"role": "user", "content": attacker})
+            history.append({"role": "assistant", "content": target})
+
+        metadata = {
+            "turn": turn,
+            "history_turns": len(recent),
+            "history_chars": sum(len(m["content"]) for m in history) + len(self.summary),
+        }
+        if gemini_tokens:
+            metadata["gemini_tokens"] = gemini_tokens
+        if summary_tokens:
+            metadata["summary_tokens"] = summary_tokens
+
+        return Turn(prompt=prompt, history=history, metadata=metadata)
@@ -1,16 +1,103 @@
+import asyncio
 import sqlite3
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
 
-def get_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect("agentxploit.db")
+import metrics
+
+T = TypeVar("T")
+
+DB_PATH = os.environ.get("AGENTXPLOIT_DB", "agentxploit.db")
+
+# applied once to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",       #readers don't block the writer
+    "PRAGMA synchronous=NORMAL",     #fsync on checkpoint instead of on every commit (safe with WAL)
+    "PRAGMA cache_size=-20000",      #~20MB page cache per connection
+    "PRAGMA mmap_size=268435456",    #256MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",      #wait for the write lock instead of failing with "database is locked"
+)
+
+# one long-lived connection per thread - sqlite connections can't be shared between threads
+_local = threading.local()
+_all_connections: list[sqlite3.Connection] = []
+_lock = threading.Lock()
+_generation = 0  #bumped by close_connections so threads reopen instead of reusing a closed connection
+
+# dedicated threads for DB work so async code never blocks the event loop on sqlite,
+# and doesn't compete with the request threadpool. Each thread keeps its own pooled connection.
+DB_WORKERS = int(os.environ.get("AGENTXPLOIT_DB_WORKERS", "4"))
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
-    print("DB PATH:", os.path.abspath("database.db"))
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
-def create_tables() -> None:
+
+def get_connection() -> sqlite3.Connection:
+    """Returns this thread's connection, opening it on first use. Don't close it."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn = conn
+        _local.generation = _generation
+        with _lock:
+            _all_connections.append(conn)
+    return conn
+
+
+@contextmanager
+def db() -> Iterator[sqlite3.Connection]:
+    """
+    Runs a block as one transaction on this thread's pooled connection.
+    Commits when the block ends, rolls back if it raises.
+    """
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+async def run(fn: Callable[..., T], *args: Any) -> T:
+    """Runs a blocking DB helper on the DB threads and awaits its result."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, fn, *args)
+    finally:
+        #includes the wait for a free DB thread, which is where contention shows up
+        metrics.db_seconds.observe(time.perf_counter() - start, op=fn.__name__)
+
+
+def close_connections() -> None:
+    """Closes every pooled connection (call on shutdown)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        while _all_connections:
+            _all_connections.pop().close()
+
+
+# ==========================
+# SCHEMA MIGRATIONS
+# ==========================
+# Each migration runs once, in order, in its own transaction, and is recorded in schema_version.
+# To change the schema add a new function to the end of MIGRATIONS - never edit one that has shipped.
+
+def _create_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS messages (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id VARCHAR(50) NOT NULL,
@@ -20,7 +107,7 @@ def create_tables() -> None:
             FOREIGN KEY (session_id) REFERENCES sessions(session_id)
         )
     """)
-    cursor.execute("""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS sessions (
         session_id VARCHAR(50) PRIMARY KEY,
         target_model VARCHAR(50) NOT NULL,
@@ -30,5 +117,312 @@ def create_tables() -> None:
         started_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
     """)
-    conn.commit()
-    conn.close()
\ No newline at end of file
+
+
+def _add_message_metadata(conn: sqlite3.Connection) -> None:
+    # some databases already got this column before migrations existed
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(messages)")]
+    if "metadata" not in columns:
+        conn.execute("ALTER TABLE messages ADD COLUMN metadata TEXT")
+
+
+def _add_lookup_indexes(conn: sqlite3.Connection) -> None:
+    # every transcript read is "WHERE session_id = ? AND id > ? ORDER BY id"
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions(status)")
+
+
+def _create_judge_cache(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS judge_cache (
+            key TEXT PRIMARY KEY,
+            verdict TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+
+def _create_attempts(conn: sqlite3.Connection) -> None:
+    # one row per generate -> target -> judge cycle, pointing at its three transcript messages
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id VARCHAR(50) NOT NULL,
+            attempt_index INTEGER NOT NULL,
+            prompt_message_id INTEGER REFERENCES messages(id),
+            response_message_id INTEGER REFERENCES messages(id),
+            verdict_message_id INTEGER REFERENCES messages(id),
+            success INTEGER NOT NULL,
+            score INTEGER,
+            judge_tier VARCHAR(50),
+            judge_latency_ms REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attempts_session_id ON attempts(session_id, success, id)")
+
+
+def _create_session_stats(conn: sqlite3.Connection) -> None:
+    # per-session counters kept current by triggers, in the same transaction as the row that changes them,
+    # so /summary is a single-row read
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS session_stats (
+            session_id VARCHAR(50) PRIMARY KEY REFERENCES sessions(session_id),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            successes INTEGER NOT NULL DEFAULT 0,
+            first_success_attempt_id INTEGER,
+            breaking_prompt_message_id INTEGER,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            target_tokens INTEGER NOT NULL DEFAULT 0,
+            gemini_tokens INTEGER NOT NULL DEFAULT 0,
+            last_activity_at DATETIME
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_session_stats_session AFTER INSERT ON sessions
+        BEGIN
+            INSERT OR IGNORE INTO session_stats (session_id) VALUES (NEW.session_id);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_session_stats_message AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO session_stats (session_id, message_count, target_tokens, gemini_tokens, last_activity_at)
+            VALUES (
+                NEW.session_id, 1,
+                COALESCE(json_extract(NEW.metadata, '$.eval_count'), 0),
+                COALESCE(json_extract(NEW.metadata, '$.gemini_tokens'), 0),
+                NEW.timestamp
+            )
+            ON CONFLICT(session_id) DO UPDATE SET
+                message_count = message_count + 1,
+                target_tokens = target_tokens + excluded.target_tokens,
+                gemini_tokens = gemini_tokens + excluded.gemini_tokens,
+                last_activity_at = MAX(COALESCE(last_activity_at, ''), excluded.last_activity_at);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_session_stats_attempt AFTER INSERT ON attempts
+        BEGIN
+            INSERT INTO session_stats (session_id, attempts, successes, first_success_attempt_id,
+                                       breaking_prompt_message_id)
+            VALUES (
+                NEW.session_id, 1, NEW.success,
+                CASE WHEN NEW.success THEN NEW.id END,
+                CASE WHEN NEW.success THEN NEW.prompt_message_id END
+            )
+            ON CONFLICT(session_id) DO UPDATE SET
+                attempts = attempts + 1,
+                successes = successes + excluded.successes,
+                first_success_attempt_id = COALESCE(first_success_attempt_id, excluded.first_success_attempt_id),
+                breaking_prompt_message_id = COALESCE(breaking_prompt_message_id,
+                                                      excluded.breaking_prompt_message_id);
+        END
+    """)
+    backfill_session_stats(conn)
+
+
+def _add_session_mode(conn: sqlite3.Connection) -> None:
+    #'single' = independent attempts, 'multi_turn' = one ongoing conversation with the target
+    conn.execute("ALTER TABLE sessions ADD COLUMN mode TEXT NOT NULL DEFAULT 'single'")
+
+
+def _create_campaigns(conn: sqlite3.Connection) -> None:
+    # a campaign is one session per (model, criteria) pair, run and stopped together
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS campaigns (
+            campaign_id VARCHAR(50) PRIMARY KEY,
+            models TEXT NOT NULL,    --JSON list, in the order they were asked for
+            criteria TEXT NOT NULL,  --JSON list
+            max_attempts INTEGER NOT NULL,
+            mode TEXT NOT NULL DEFAULT 'single',
+            per_model_concurrency INTEGER NOT NULL,
+            status VARCHAR(50) NOT NULL DEFAULT 'running',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("ALTER TABLE sessions ADD COLUMN campaign_id VARCHAR(50) REFERENCES campaigns(campaign_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_campaign_id ON sessions(campaign_id)")
+
+
+def _create_jobs(conn: sqlite3.Connection) -> None:
+    # durable work queue: a job is claimed by a worker for a lease it keeps renewing, and goes
+    # back to any worker once the lease runs out (the worker died or lost the DB)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,              --'session' or 'campaign'
+            ref_id VARCHAR(50) NOT NULL,     --the session_id or campaign_id to run
+            status TEXT NOT NULL DEFAULT 'queued',  --queued, leased, done, failed
+            tries INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires_at REAL,           --unix time
+            heartbeat_at REAL,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_expires_at)")
+    #a session or campaign can only be queued/running once at a time
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_open_ref ON jobs(kind, ref_id)
+        WHERE status IN ('queued', 'leased')
+    """)
+
+
+def _add_attempt_state(conn: sqlite3.Connection) -> None:
+    #JSON state a resumed session needs besides the attempt itself (e.g. the multi-turn summary)
+    conn.execute("ALTER TABLE attempts ADD COLUMN state TEXT")
+
+
+def _create_message_search(conn: sqlite3.Connection) -> None:
+    #FTS5 index over messages.content (external content: the text itself stays only in messages),
+    #kept in step by triggers and queried by search.py
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages
+        BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF content ON messages
+        BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', OLD.id, OLD.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (NEW.id, NEW.content);
+        END
+    """)
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")  #index existing transcripts
+    #the search success filter looks up the attempt a message belongs to
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attempts_prompt ON attempts(prompt_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attempts_response ON attempts(response_message_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attempts_verdict ON attempts(verdict_message_id)")
+
+
+def _add_judge_cache_age_index(conn: sqlite3.Connection) -> None:
+    #judge_cache pruning deletes by age: expired rows, then the oldest over the size cap
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_judge_cache_created_at ON judge_cache(created_at)")
+
+
+def backfill_session_stats(conn: sqlite3.Connection) -> int:
+    """Recomputes every session_stats row from sessions/messages/attempts. Returns the number of sessions."""
+    conn.execute("""
+        INSERT OR REPLACE INTO session_stats (
+            session_id, attempts, successes, first_success_attempt_id, breaking_prompt_message_id,
+            message_count, target_tokens, gemini_tokens, last_activity_at
+        )
+        SELECT
+            s.session_id,
+            COALESCE(a.attempts, 0),
+            COALESCE(a.successes, 0),
+            a.first_success_attempt_id,
+            (SELECT prompt_message_id FROM attempts WHERE id = a.first_success_attempt_id),
+            COALESCE(m.message_count, 0),
+            COALESCE(m.target_tokens, 0),
+            COALESCE(m.gemini_tokens, 0),
+            m.last_activity_at
+        FROM sessions s
+        LEFT JOIN (
+            SELECT session_id, COUNT(*) AS attempts, SUM(success) AS successes,
+                   MIN(CASE WHEN success THEN id END) AS first_success_attempt_id
+            FROM attempts GROUP BY session_id
+        ) a ON a.session_id = s.session_id
+        LEFT JOIN (
+            SELECT session_id, COUNT(*) AS message_count,
+                   SUM(COALESCE(json_extract(metadata, '$.eval_count'), 0)) AS target_tokens,
+                   SUM(COALESCE(json_extract(metadata, '$.gemini_tokens'), 0)) AS gemini_tokens,
+                   MAX(timestamp) AS last_activity_at
+            FROM messages GROUP BY session_id
+        ) m ON m.session_id = s.session_id
+    """)
+    return conn.execute("SELECT COUNT(*) FROM session_stats").fetchone()[0]
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_message_metadata,
+    _add_lookup_indexes,
+    _create_judge_cache,
+    _create_attempts,
+    _create_session_stats,
+    _add_session_mode,
+    _create_campaigns,
+    _create_jobs,
+    _add_attempt_state,
+    _create_message_search,
+    _add_judge_cache_age_index,
+]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(target: Optional[int] = None) -> int:
+    """Applies every migration newer than the database's version (up to target). Returns the new version."""
+    target = len(MIGRATIONS) if target is None else target
+    conn = get_connection()
+    conn.commit()  #don't fold an open transaction into the migration
+
+    version = schema_version(conn)
+    while version < target:
+        #IMMEDIATE takes the write lock up front, so two processes starting together can't both migrate
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version >= target:
+                conn.rollback()
+                break
+            migration = MIGRATIONS[version]
+            migration(conn)
+            version += 1
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, migration.__name__.lstrip("_"))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return version
+
+
+def create_tables() -> None:
+    """Creates the schema or brings an existing agentxploit.db up to date."""
+    migrate()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="AgentXploit database maintenance")
+    parser.add_argument("command", choices=["migrate", "backfill-summaries"])
+    args = parser.parse_args()
+
+    version = migrate()
+    if args.command == "migrate":
+        print(f"schema at version {version}")
+    else:
+        with db() as conn:
+            count = backfill_session_stats(conn)
+        print(f"rebuilt summaries for {count} sessions")
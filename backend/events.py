@@ -0,0 +1,35 @@
+import asyncio
+from collections import defaultdict
+
+# per-session fan-out of new messages and status changes to /events subscribers.
+# Everything here runs on the event loop thread, so no locking is needed.
+
+MAX_PENDING = 1000  #events buffered per subscriber before it's dropped as too slow
+
+_subscribers: dict[str, set[asyncio.Queue]] = defaultdict(set)
+
+
+def subscribe(session_id: str) -> asyncio.Queue:
+    queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING)
+    _subscribers[session_id].add(queue)
+    return queue
+
+
+def unsubscribe(session_id: str, queue: asyncio.Queue) -> None:
+    queues = _subscribers.get(session_id)
+    if queues is None:
+        return
+    queues.discard(queue)
+    if not queues:
+        del _subscribers[session_id]
+
+
+def publish(session_id: str, event: dict) -> None:
+    for queue in list(_subscribers.get(session_id, ())):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            #a stuck client shouldn't grow memory forever - cut it off, it can reconnect with since_id
+            unsubscribe(session_id, queue)
+            queue.get_nowait()
+            queue.put_nowait(None)
@@ -0,0 +1,216 @@
+"""
+Bulk transcript export across sessions, as JSONL or (with pyarrow installed) Parquet / Arrow.
+
+    python export.py results.jsonl [--campaign ID] [--model M] [--status S] [--session ID ...]
+    python export.py results.parquet --sender target --since-id 1500000
+
+Rows are read in keyset pages of EXPORT_BATCH messages and written as they arrive, so memory
+stays flat however large the export is. GET /api/export streams the same output over HTTP.
+"""
+import io
+import json
+import os
+import sys
+from typing import AsyncIterator, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+import database
+from database import db
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  #optional - only needed for the columnar formats
+    pa = None
+
+EXPORT_BATCH = int(os.environ.get("AGENTXPLOIT_EXPORT_BATCH", "2000"))  #messages per page / row group
+
+FORMATS = {
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+COLUMNS = ("message_id", "session_id", "campaign_id", "target_model", "mode", "success_criteria",
+           "session_status", "sender", "content", "timestamp", "metadata")
+
+
+class ExportFilters(BaseModel):
+    session_ids: List[str] = []
+    campaign_id: Optional[str] = None
+    model: Optional[str] = None
+    status: Optional[str] = None   #session status, e.g. success_found
+    sender: Optional[str] = None   #attacker, target or judge
+    since_id: int = 0              #only messages with a larger id - for incremental exports
+
+
+def fetch_page(filters: ExportFilters, after: tuple[str, int], limit: int) -> List[dict]:
+    """The next `limit` messages after the (session_id, message id) key, in session then message order."""
+    where = ["(m.session_id, m.id) > (?, ?)", "m.id > ?"]
+    params: list = [after[0], after[1], filters.since_id]
+    if filters.session_ids:
+        where.append(f"m.session_id IN ({', '.join('?' * len(filters.session_ids))})")
+        params.extend(filters.session_ids)
+    for column, value in (("s.campaign_id", filters.campaign_id), ("s.target_model", filters.model),
+                          ("s.status", filters.status), ("m.sender", filters.sender)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+
+    with db() as conn:
+        rows = conn.execute(f"""
+            SELECT m.id AS message_id, m.session_id, s.campaign_id, s.target_model, s.mode, s.success_criteria,
+                   s.status AS session_status, m.sender, m.content, m.timestamp, m.metadata
+            FROM messages m JOIN sessions s ON s.session_id = m.session_id
+            WHERE {" AND ".join(where)}
+            ORDER BY m.session_id, m.id
+            LIMIT ?
+        """, (*params, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def _next_key(page: List[dict]) -> tuple[str, int]:
+    return page[-1]["session_id"], page[-1]["message_id"]
+
+
+def iter_pages(filters: ExportFilters, batch_size: int = EXPORT_BATCH) -> Iterator[List[dict]]:
+    #short queries per page instead of one long-lived cursor: a pooled connection isn't held for the
+    #whole export and WAL checkpoints aren't blocked by an open read
+    key = ("", 0)
+    while True:
+        page = fetch_page(filters, key, batch_size)
+        if page:
+            yield page
+        if len(page) < batch_size:
+            return
+        key = _next_key(page)
+
+
+async def aiter_pages(filters: ExportFilters, batch_size: int = EXPORT_BATCH) -> AsyncIterator[List[dict]]:
+    key = ("", 0)
+    while True:
+        page = await database.run(fetch_page, filters, key, batch_size)
+        if page:
+            yield page
+        if len(page) < batch_size:
+            return
+        key = _next_key(page)
+
+
+class JsonlEncoder:
+
+    def encode(self, page: List[dict]) -> bytes:
+        lines = []
+        for row in page:
+            row = dict(row, metadata=json.loads(row["metadata"]) if row["metadata"] else None)
+            lines.append(json.dumps(row, ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode()
+
+    def close(self) -> bytes:
+        return b""
+
+
+class _Sink(io.RawIOBase):
+    """Write-only buffer pyarrow writes into; drained after every page."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class ArrowEncoder:
+    """One Parquet row group / Arrow record batch per page."""
+
+    def __init__(self, fmt: str):
+        self.sink = _Sink()
+        self.schema = pa.schema([(name, pa.int64() if name == "message_id" else pa.string()) for name in COLUMNS])
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(self.sink, self.schema, compression="zstd")
+        else:
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def encode(self, page: List[dict]) -> bytes:
+        batch = pa.RecordBatch.from_pydict({name: [row[name] for row in page] for name in COLUMNS}, self.schema)
+        self.writer.write_batch(batch)
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+
+def encoder(fmt: str):
+    """An encoder for `fmt`; ValueError for unknown formats or a columnar one without pyarrow."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(FORMATS)})")
+    if fmt == "jsonl":
+        return JsonlEncoder()
+    if pa is None:
+        raise ValueError(f"Exporting {fmt} needs pyarrow (pip install pyarrow)")
+    return ArrowEncoder(fmt)
+
+
+async def stream_export(filters: ExportFilters, out) -> AsyncIterator[bytes]:
+    """The export as chunks of bytes, one per page, encoded by `out` (from encoder())."""
+    async for page in aiter_pages(filters):
+        yield out.encode(page)
+    yield out.close()
+
+
+def export_to(path: str, filters: ExportFilters, fmt: str) -> int:
+    """Writes the export to `path` ('-' for stdout). Returns the number of messages."""
+    out = encoder(fmt)
+    count = 0
+    stream = sys.stdout.buffer if path == "-" else open(path, "wb")
+    try:
+        for page in iter_pages(filters):
+            stream.write(out.encode(page))
+            count += len(page)
+        stream.write(out.close())
+    finally:
+        if stream is not sys.stdout.buffer:
+            stream.close()
+    return count
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export AgentXploit transcripts")
+    parser.add_argument("output", help="file to write, or - for stdout")
+    parser.add_argument("--format", choices=list(FORMATS), help="default: from the file extension, else jsonl")
+    parser.add_argument("--session", action="append", default=[], dest="session_ids")
+    parser.add_argument("--campaign")
+    parser.add_argument("--model")
+    parser.add_argument("--status")
+    parser.add_argument("--sender")
+    parser.add_argument("--since-id", type=int, default=0)
+    args = parser.parse_args()
+
+    extension = os.path.splitext(args.output)[1].lstrip(".")
+    fmt = args.format or (extension if extension in FORMATS else "jsonl")
+    filters = ExportFilters(session_ids=args.session_ids, campaign_id=args.campaign, model=args.model,
+                            status=args.status, sender=args.sender, since_id=args.since_id)
+    database.create_tables()
+    try:
+        count = export_to(args.output, filters, fmt)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"Exported {count} messages", file=sys.stderr)
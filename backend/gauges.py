@@ -0,0 +1,32 @@
+import control
+import gemini
+import metrics
+import ollama
+from campaign import queued_sessions
+from writer import writer
+
+# gauges every process that runs sessions reports about itself - the API (its embedded worker)
+# and each worker.py process. Registered on import.
+
+
+def _session_counts() -> dict:
+    counts = control.count_by_status()
+    return {
+        (("state", "active"),): counts.get("running", 0),
+        (("state", "paused"),): counts.get("paused", 0),
+        (("state", "queued"),): queued_sessions(),
+    }
+
+
+def _queue_lengths() -> dict:
+    gemini_stats = gemini.scheduler.stats()
+    return {
+        (("queue", "gemini_judge"),): gemini_stats.queued_judge,
+        (("queue", "gemini_generate"),): gemini_stats.queued_generate,
+        (("queue", "targets"),): sum(ollama.scheduler.stats().queued.values()),
+        (("queue", "writer"),): writer.stats().queue_depth,
+    }
+
+
+metrics.gauge("agentxploit_sessions", "Sessions in this process by state", _session_counts)
+metrics.gauge("agentxploit_queue_length", "Requests waiting in each internal queue", _queue_lengths)
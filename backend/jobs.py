@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+
+from database import db, get_connection
+from logic import FINAL_STATUSES
+
+# the jobs table is the work queue between the API and the workers (worker.py). The API only
+# enqueues; a worker leases a job, renews the lease while it runs, and marks it done. A job
+# whose lease runs out - the worker crashed or was killed - is leased again by any worker.
+
+LEASE_SECONDS = float(os.environ.get("AGENTXPLOIT_JOB_LEASE", "60"))  #how long a job stays claimed without a heartbeat
+MAX_TRIES = int(os.environ.get("AGENTXPLOIT_JOB_MAX_TRIES", "3"))    #leases before a job that keeps dying is failed
+
+
+class AlreadyQueued(Exception):
+    pass
+
+
+class Job(BaseModel):
+    id: int
+    kind: str    #'session' or 'campaign'
+    ref_id: str  #session_id or campaign_id
+    tries: int
+
+
+def _insert(conn: sqlite3.Connection, kind: str, ref_id: str) -> int:
+    try:
+        cursor = conn.execute("INSERT INTO jobs (kind, ref_id) VALUES (?, ?)", (kind, ref_id))
+    except sqlite3.IntegrityError:
+        raise AlreadyQueued(f"This {kind} is already queued or running")
+    return cursor.lastrowid
+
+
+def enqueue_session(session_id: str) -> int:
+    """Queues a session for the workers and marks it 'queued'. Returns the job id."""
+    with db() as conn:
+        if not conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone():
+            raise ValueError("Session not found")
+        job_id = _insert(conn, "session", session_id)
+        conn.execute("UPDATE sessions SET status = 'queued' WHERE session_id = ?", (session_id,))
+    return job_id
+
+
+def enqueue_campaign(campaign_id: str) -> int:
+    """Queues a whole campaign as one job - its sessions share the campaign's per-model limits."""
+    with db() as conn:
+        if not conn.execute("SELECT 1 FROM campaigns WHERE campaign_id = ?", (campaign_id,)).fetchone():
+            raise ValueError("Campaign not found")
+        job_id = _insert(conn, "campaign", campaign_id)
+        conn.execute("UPDATE sessions SET status = 'queued' WHERE campaign_id = ? AND status = 'initialized'",
+                     (campaign_id,))
+    return job_id
+
+
+def _fail(conn: sqlite3.Connection, job_id: int, kind: str, ref_id: str, error: str) -> None:
+    conn.execute("""
+        UPDATE jobs SET status = 'failed', last_error = ?, lease_owner = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """, (error, job_id))
+    placeholders = ", ".join("?" * len(FINAL_STATUSES))
+    column = "session_id" if kind == "session" else "campaign_id"
+    conn.execute(f"UPDATE sessions SET status = 'failed' WHERE {column} = ? AND status NOT IN ({placeholders})",
+                 (ref_id, *FINAL_STATUSES))
+    if kind == "campaign":
+        conn.execute("UPDATE campaigns SET status = 'failed' WHERE campaign_id = ? AND status = 'running'", (ref_id,))
+
+
+def claim(owner: str, lease_seconds: float = LEASE_SECONDS) -> Optional[Job]:
+    """Leases the oldest queued job, or one whose lease has run out. None if there's nothing to run."""
+    conn = get_connection()
+    conn.commit()
+    #IMMEDIATE takes the write lock before the SELECT, so two workers can't lease the same job
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        while True:
+            row = conn.execute("""
+                SELECT id, kind, ref_id, tries FROM jobs
+                WHERE status = 'queued' OR (status = 'leased' AND lease_expires_at < ?)
+                ORDER BY id LIMIT 1
+            """, (now,)).fetchone()
+            if row is None:
+                conn.commit()
+                return None
+            if row["tries"] >= MAX_TRIES:
+                _fail(conn, row["id"], row["kind"], row["ref_id"], f"lease expired {row['tries']} times")
+                continue
+
+            conn.execute("""
+                UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires_at = ?, heartbeat_at = ?,
+                                tries = tries + 1
+                WHERE id = ?
+            """, (owner, now + lease_seconds, now, row["id"]))
+            conn.commit()
+            return Job(id=row["id"], kind=row["kind"], ref_id=row["ref_id"], tries=row["tries"] + 1)
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def heartbeat(job_id: int, owner: str, lease_seconds: float = LEASE_SECONDS) -> bool:
+    """Extends the lease. False if this worker no longer holds it (it expired and another worker took the job)."""
+    now = time.time()
+    with db() as conn:
+        cursor = conn.execute("""
+            UPDATE jobs SET lease_expires_at = ?, heartbeat_at = ?
+            WHERE id = ? AND lease_owner = ? AND status = 'leased'
+        """, (now + lease_seconds, now, job_id, owner))
+    return cursor.rowcount == 1
+
+
+def finish(job_id: int, owner: str, error: Optional[str] = None) -> None:
+    """Marks a leased job done, or failed with `error`."""
+    with db() as conn:
+        conn.execute("""
+            UPDATE jobs SET status = ?, last_error = ?, lease_owner = NULL, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND lease_owner = ? AND status = 'leased'
+        """, ("failed" if error else "done", error, job_id, owner))
+
+
+def release(job_id: int, owner: str) -> None:
+    """Puts a job back in the queue without counting the try (the worker is shutting down, not crashing)."""
+    with db() as conn:
+        row = conn.execute("SELECT kind, ref_id FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                           (job_id, owner)).fetchone()
+        if row is None:
+            return
+        conn.execute("""
+            UPDATE jobs SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL, tries = tries - 1
+            WHERE id = ?
+        """, (job_id,))
+        column = "session_id" if row["kind"] == "session" else "campaign_id"
+        conn.execute(f"UPDATE sessions SET status = 'queued' WHERE {column} = ? AND status = 'running'",
+                     (row["ref_id"],))
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover(hostname: str) -> int:
+    """
+    Requeues work a crash left behind, so it resumes from its checkpoints right away:
+    - jobs leased by worker processes on this host that no longer exist (no need to wait out the lease)
+    - sessions and campaigns still marked as started that have no job at all, e.g. from before the queue
+    Returns how many jobs were requeued or created.
+    """
+    recovered = 0
+    with db() as conn:
+        for row in conn.execute("SELECT id, lease_owner FROM jobs WHERE status = 'leased'").fetchall():
+            owner_host, _, rest = row["lease_owner"].partition(":")
+            pid = rest.split(":")[0]
+            if owner_host == hostname and pid.isdigit() and not _process_alive(int(pid)):
+                #expired rather than released: the crash still counts as a try
+                conn.execute("UPDATE jobs SET lease_expires_at = 0 WHERE id = ?", (row["id"],))
+                recovered += 1
+
+        recovered += conn.execute("""
+            INSERT OR IGNORE INTO jobs (kind, ref_id)
+            SELECT 'session', s.session_id FROM sessions s
+            WHERE s.status IN ('queued', 'running', 'paused') AND s.campaign_id IS NULL
+              AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.kind = 'session' AND j.ref_id = s.session_id
+                              AND j.status IN ('queued', 'leased'))
+        """).rowcount
+        recovered += conn.execute("""
+            INSERT OR IGNORE INTO jobs (kind, ref_id)
+            SELECT 'campaign', c.campaign_id FROM campaigns c
+            WHERE c.status = 'running'
+              AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.kind = 'campaign' AND j.ref_id = c.campaign_id
+                              AND j.status IN ('queued', 'leased'))
+        """).rowcount
+    return recovered
+
+
+def count_open() -> dict[str, int]:
+    """Queued and leased job counts (done/failed jobs pile up, so they aren't counted)."""
+    with db() as conn:
+        rows = conn.execute("""
+            SELECT status, COUNT(*) AS n FROM jobs WHERE status IN ('queued', 'leased') GROUP BY status
+        """).fetchall()
+    return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from pydantic import BaseModel
+
+import database
+
+MAX_ENTRIES = int(os.environ.get("AGENTXPLOIT_JUDGE_CACHE_SIZE", "10000"))
+TTL_SECONDS = float(os.environ.get("AGENTXPLOIT_JUDGE_CACHE_TTL", "86400"))
+PERSIST = os.environ.get("AGENTXPLOIT_JUDGE_CACHE_DB", "1") == "1"  #also keep verdicts in the judge_cache table
+DB_MAX_ENTRIES = int(os.environ.get("AGENTXPLOIT_JUDGE_CACHE_DB_SIZE", "100000"))  #rows kept in the judge_cache table
+PRUNE_EVERY = 500  #table writes between prunes (the first write in a process prunes too)
+
+
+class JudgeCacheStats(BaseModel):
+    entries: int
+    memory_hits: int
+    db_hits: int
+    coalesced: int  #callers that waited on an identical judge call already in flight
+    misses: int
+    hit_rate: float
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+def cache_key(success_criteria: str, target_response: str) -> str:
+    """Same criteria + same response (ignoring case and whitespace) -> same key."""
+    raw = _normalize(success_criteria) + "\0" + _normalize(target_response)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _db_get(key: str, min_created: float) -> Optional[tuple[str, float]]:
+    with database.db() as conn:
+        row = conn.execute(
+            "SELECT verdict, created_at FROM judge_cache WHERE key = ? AND created_at >= ?",
+            (key, min_created)
+        ).fetchone()
+    return (row["verdict"], row["created_at"]) if row else None
+
+
+def _db_put(key: str, verdict: str, created_at: float) -> None:
+    with database.db() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO judge_cache (key, verdict, created_at) VALUES (?, ?, ?)",
+            (key, verdict, created_at)
+        )
+
+
+def _db_prune(min_created: float, max_rows: int) -> int:
+    """Deletes expired rows, then the oldest ones over max_rows. Returns how many were deleted."""
+    with database.db() as conn:
+        deleted = conn.execute("DELETE FROM judge_cache WHERE created_at < ?", (min_created,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM judge_cache").fetchone()[0] - max_rows
+        if excess > 0:
+            deleted += conn.execute("""
+                DELETE FROM judge_cache WHERE key IN (
+                    SELECT key FROM judge_cache ORDER BY created_at LIMIT ?
+                )
+            """, (excess,)).rowcount
+    return deleted
+
+
+class JudgeCache:
+    """
+    Verdict cache for the Gemini judge: an in-memory LRU in front of an optional sqlite table,
+    both with a TTL. Identical judge calls that are already in flight are shared, not repeated.
+    The table is pruned of expired rows, and capped at db_max_entries, every PRUNE_EVERY writes.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS, persist: bool = PERSIST,
+                 db_max_entries: int = DB_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.db_max_entries = db_max_entries
+        self._db_writes = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()  #key -> (verdict, created_at)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    def _remember(self, key: str, verdict: str, created_at: float) -> None:
+        self._entries[key] = (verdict, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, success_criteria: str, target_response: str,
+                             compute: Callable[[], Awaitable[str]]) -> str:
+        key = cache_key(success_criteria, target_response)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            verdict, created_at = entry
+            if now - created_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return verdict
+            del self._entries[key]
+
+        if key in self._in_flight:
+            try:
+                verdict = await asyncio.shield(self._in_flight[key])
+                self.coalesced += 1
+                return verdict
+            except Exception:
+                pass  #the shared call failed - make our own below
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            cached = await database.run(_db_get, key, now - self.ttl) if self.persist else None
+            if cached is not None:
+                self.db_hits += 1
+                verdict, created_at = cached
+            else:
+                self.misses += 1
+                verdict = await compute()
+                created_at = time.time()
+                if self.persist:
+                    if self._db_writes % PRUNE_EVERY == 0:
+                        await database.run(_db_prune, created_at - self.ttl, self.db_max_entries)
+                    self._db_writes += 1
+                    await database.run(_db_put, key, verdict, created_at)
+
+            self._remember(key, verdict, created_at)
+            future.set_result(verdict)
+            return verdict
+
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("judge call cancelled"))
+            future.exception()  #waiters fall back to their own call, don't warn about it
+            raise
+
+        finally:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> JudgeCacheStats:
+        hits = self.memory_hits + self.db_hits + self.coalesced
+        total = hits + self.misses
+        return JudgeCacheStats(
+            entries=len(self._entries),
+            memory_hits=self.memory_hits,
+            db_hits=self.db_hits,
+            coalesced=self.coalesced,
+            misses=self.misses,
+            hit_rate=hits / total if total else 0.0,
+        )
+
+
+# one cache for the whole app
+judge_cache = JudgeCache()
@@ -0,0 +1,40 @@
+import logging
+import os
+import random
+
+# leveled logging for the backend. Per-attempt and per-poll records are marked
+# extra={"sampled": True} and only LOG_SAMPLE of them are kept, so logging stays cheap
+# under load; warnings and errors are always kept.
+
+LOG_LEVEL = os.environ.get("AGENTXPLOIT_LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE = float(os.environ.get("AGENTXPLOIT_LOG_SAMPLE", "0.01"))  #share of hot-path records kept
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class SampledFilter(logging.Filter):
+
+    def __init__(self, rate: float = LOG_SAMPLE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+def configure_logging(level: str = LOG_LEVEL, sample: float = LOG_SAMPLE) -> None:
+    """Sets up the "backend" loggers once; later calls only change the level and sample rate."""
+    logger = logging.getLogger("backend")
+    logger.setLevel(level)
+    for handler in logger.handlers:
+        for f in handler.filters:
+            if isinstance(f, SampledFilter):
+                f.rate = sample
+                return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(SampledFilter(sample))
+    logger.addHandler(handler)
+    logger.propagate = False
@@ -1,9 +1,41 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from logs import configure_logging
 from routes import router
-from database import create_tables
+from database import create_tables, close_connections
+from ollama import close_client
+from writer import writer
 from logic import HealthStatus
+from worker import Worker
+import database
+import gauges  #this process's session and queue gauges
+import jobs
+import metrics
 from fastapi.middleware.cors import CORSMiddleware
-app = FastAPI(title="AgentXploit", description="Automated jailbreak testing")
+
+
+# run queued jobs in the API process too; set to 0 when separate worker.py processes do it
+EMBEDDED_WORKER = os.environ.get("AGENTXPLOIT_EMBEDDED_WORKER", "1") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = Worker() if EMBEDDED_WORKER else None
+    worker_task = asyncio.create_task(worker.run()) if worker else None
+    yield
+    if worker is not None:
+        worker.stop()  #running jobs go back to the queue
+        await worker_task
+    await writer.close()
+    await close_client()
+    close_connections()
+
+configure_logging()
+
+app = FastAPI(title="AgentXploit", description="Automated jailbreak testing", lifespan=lifespan)
 
 app.include_router(router)
 
@@ -13,6 +45,28 @@ create_tables()
 def health_check() -> HealthStatus:
     return HealthStatus(status="AgentXploit is running")
 
+# the jobs table is shared by every worker, so only the API reports it
+_job_counts: dict = {}  #jobs.count_open() as of the current scrape - read from the DB before rendering
+
+
+def _open_jobs() -> dict:
+    return {(("status", status),): _job_counts.get(status, 0) for status in ("queued", "leased")}
+
+
+metrics.gauge("agentxploit_jobs", "Jobs waiting for a worker (queued) or running (leased), across all workers",
+              _open_jobs)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Stage, Gemini, Ollama and DB latency histograms plus session and queue gauges, for Prometheus."""
+    #async, so the gauges read the schedulers' and sessions' state on the event loop that owns it;
+    #the one query runs on the DB threads
+    counts = await database.run(jobs.count_open)
+    _job_counts.clear()
+    _job_counts.update(counts)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Enable CORS: Allows the frontend at http://localhost:3000 to communicate with this API, permitting all methods and credentials.
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+import metrics
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+CONNECT_TIMEOUT = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("OLLAMA_READ_TIMEOUT", "120"))  #max gap between streamed chunks, not whole reply
+RETRIES = int(os.environ.get("OLLAMA_RETRIES", "2"))
+RETRY_BACKOFF = 0.5  #seconds, doubled on every retry
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")  #how long Ollama keeps a model loaded after our last request
+RESIDENT_MODELS = int(os.environ.get("AGENTXPLOIT_RESIDENT_MODELS", "1"))  #models we let Ollama hold at once, 0 = no limit
+MODEL_PARALLEL = int(os.environ.get("AGENTXPLOIT_MODEL_PARALLEL", "4"))    #requests in flight per model (OLLAMA_NUM_PARALLEL)
+MAX_COLD_WAIT = float(os.environ.get("AGENTXPLOIT_MAX_COLD_WAIT", "30"))   #seconds a cold model waits before one is evicted for it
+#models kept loaded outside the RESIDENT_MODELS limit - by default the judge's prejudge model, which
+#is asked after every attempt and would otherwise swap places with the target each time
+PINNED_MODELS = [m for m in os.environ.get("AGENTXPLOIT_PINNED_MODELS",
+                                           os.environ.get("AGENTXPLOIT_PREJUDGE_MODEL", "")).split(",") if m]
+IDLE_GRACE = float(os.environ.get("AGENTXPLOIT_MODEL_IDLE_GRACE", "5"))    #an idle model keeps its slot this long (sessions pause between attempts)
+LOAD_THRESHOLD_MS = 100  #a load_duration above this means Ollama really (re)loaded the model
+
+logger = logging.getLogger("backend.ollama")
+
+# one keep-alive client for the whole app - created lazily so it binds to the running event loop
+_client: Optional[httpx.AsyncClient] = None
+
+
+class TargetReply(BaseModel):
+    """What the target model answered, plus timing for the transcript metadata"""
+    content: str
+    ttft_ms: Optional[float]        #time to first token
+    total_ms: float
+    eval_count: int                 #tokens generated
+    prompt_eval_count: Optional[int] = None  #prompt tokens the model processed, conversation history included
+    load_ms: Optional[float] = None  #time Ollama spent loading the model for this request
+    tokens_per_sec: Optional[float]
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=OLLAMA_URL,
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=16),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def list_models() -> List[str]:
+    response = await get_client().get("/api/tags", timeout=CONNECT_TIMEOUT)
+    response.raise_for_status()
+    return [model["name"] for model in response.json().get("models", [])]
+
+
+async def _stream_chat(model: str, messages: List[dict]) -> TargetReply:
+    start = time.perf_counter()
+    first_token_at = None
+    parts = []
+    chunks = 0
+    final = {}
+
+    payload = {"model": model, "messages": messages, "stream": True, "keep_alive": KEEP_ALIVE}
+    async with get_client().stream("POST", "/api/chat", json=payload) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if "error" in chunk:
+                raise RuntimeError(f"Ollama error: {chunk['error']}")
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(token)
+                chunks += 1
+            if chunk.get("done"):
+                final = chunk
+                break
+
+    end = time.perf_counter()
+
+    # ollama reports exact counts/durations (ns) in the last chunk; fall back to our own timing
+    eval_count = final.get("eval_count", chunks)
+    eval_ns = final.get("eval_duration")
+    if eval_ns:
+        tokens_per_sec = eval_count / (eval_ns / 1e9)
+    elif first_token_at is not None and end > first_token_at:
+        tokens_per_sec = eval_count / (end - first_token_at)
+    else:
+        tokens_per_sec = None
+
+    return TargetReply(
+        content="".join(parts),
+        ttft_ms=(first_token_at - start) * 1000 if first_token_at is not None else None,
+        total_ms=(end - start) * 1000,
+        eval_count=eval_count,
+        prompt_eval_count=final.get("prompt_eval_count"),
+        load_ms=final["load_duration"] / 1e6 if final.get("load_duration") is not None else None,
+        tokens_per_sec=tokens_per_sec,
+    )
+
+
+async def unload(model: str) -> None:
+    """Asks Ollama to free a model's memory now instead of when keep_alive runs out."""
+    try:
+        response = await get_client().post("/api/chat", json={"model": model, "messages": [], "keep_alive": 0})
+        response.raise_for_status()
+    except Exception as e:
+        logger.warning(f"Failed to unload {model}: {e}")
+
+
+class TargetSchedulerStats(BaseModel):
+    resident: List[str]
+    queued: dict  #model -> requests waiting
+    in_flight: int
+    requests: int
+    warm_hits: int  #requests sent to a model that was already loaded
+    loads: int      #times a model was let in
+    reloads: int    #loads of a model that had been evicted before
+    evictions: int
+    observed_loads: int     #requests where Ollama reported actually loading the model
+    load_seconds: float     #total load time Ollama reported
+
+
+class TargetScheduler:
+    """
+    Orders requests to local models so Ollama isn't made to swap models back and forth:
+    - requests are queued per model, and models already loaded are served first
+    - at most `resident` models are in use at once; another model gets in when one has been idle
+      for idle_grace, or after it has waited max_cold_wait, by evicting the least recently used
+      one (which stops getting new requests and is unloaded once its last request finishes)
+    - up to `parallel` requests per model are in flight at once
+    - `pinned` models have slots of their own: loaded on first use, never evicted, and not
+      counted against `resident`
+    """
+
+    def __init__(self, resident: int = RESIDENT_MODELS, parallel: int = MODEL_PARALLEL,
+                 max_cold_wait: float = MAX_COLD_WAIT, idle_grace: float = IDLE_GRACE,
+                 pinned: List[str] = PINNED_MODELS):
+        self.resident = resident
+        self.pinned = set(pinned)
+        self.parallel = parallel
+        self.max_cold_wait = max_cold_wait
+        self.idle_grace = idle_grace
+        self._pending: OrderedDict[str, deque] = OrderedDict()  #model -> deque of (future, queued_at)
+        self._resident: OrderedDict[str, None] = OrderedDict()  #least recently used first
+        self._in_flight: dict[str, int] = {}
+        self._draining: set[str] = set()  #evicted, waiting for their last requests to finish
+        self._ever_loaded: set[str] = set()
+        self._last_active: dict[str, float] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.requests = 0
+        self.warm_hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.observed_loads = 0
+        self.load_seconds = 0.0
+
+    def _waiting(self, model: str) -> bool:
+        waiters = self._pending.get(model)
+        while waiters and waiters[0][0].done():  #cancelled while queued
+            waiters.popleft()
+        if not waiters:
+            self._pending.pop(model, None)
+            return False
+        return True
+
+    def _grant(self, model: str) -> bool:
+        if not self._waiting(model):
+            return False
+        future, _ = self._pending[model].popleft()
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        self._last_active[model] = time.monotonic()
+        self._resident.move_to_end(model)
+        future.set_result(None)
+        return True
+
+    def _admit(self, model: str) -> None:
+        self._resident[model] = None
+        self.loads += 1
+        if model in self._ever_loaded:
+            self.reloads += 1
+        self._ever_loaded.add(model)
+
+    def _evict(self, model: str) -> None:
+        del self._resident[model]
+        self._draining.discard(model)
+        self.evictions += 1
+        asyncio.create_task(unload(model))
+
+    def _held(self) -> int:
+        """Resident models taking up one of the `resident` slots"""
+        return sum(1 for model in self._resident if model not in self.pinned)
+
+    def _oldest_wait(self, model: str) -> float:
+        waiters = self._pending.get(model)
+        return time.monotonic() - waiters[0][1] if waiters else 0.0
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self.resident:  #no limit - plain per-model concurrency
+            for model in list(self._pending):
+                warm = model in self._resident
+                if not warm:
+                    self._admit(model)
+                while self._in_flight.get(model, 0) < self.parallel and self._grant(model):
+                    self.warm_hits += warm
+            return
+
+        for model in list(self._pending):
+            if model in self.pinned and model not in self._resident and self._waiting(model):
+                self._admit(model)  #no slot to wait for
+                while self._in_flight.get(model, 0) < self.parallel and self._grant(model):
+                    pass
+
+        cold = [m for m in list(self._pending) if m not in self._resident and self._waiting(m)]
+        if not cold:
+            self._draining.clear()  #whoever they were evicted for is gone
+
+        #warm models first
+        for model in list(self._resident):
+            if model in self._draining:
+                continue
+            while self._in_flight.get(model, 0) < self.parallel and self._grant(model):
+                self.warm_hits += 1
+
+        #then cold models, longest waiting first
+        now = time.monotonic()
+        retry_in = None
+        for model in sorted(cold, key=self._oldest_wait, reverse=True):
+            for victim in list(self._resident):
+                if self._held() < self.resident:
+                    break
+                if victim in self.pinned or self._in_flight.get(victim):
+                    continue
+                if victim in self._draining:
+                    self._evict(victim)
+                    continue
+                idle_for = now - self._last_active.get(victim, 0.0)
+                if not self._waiting(victim) and idle_for >= self.idle_grace:
+                    self._evict(victim)
+                elif not self._waiting(victim):
+                    wait = self.idle_grace - idle_for
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+
+            if self._held() < self.resident:
+                self._admit(model)
+                while self._in_flight.get(model, 0) < self.parallel and self._grant(model):
+                    pass
+            elif self._oldest_wait(model) >= self.max_cold_wait:
+                if not self._draining:
+                    #nobody goes idle on their own - stop feeding the least recently used model
+                    self._draining.add(next(m for m in self._resident if m not in self.pinned))
+            else:
+                wait = self.max_cold_wait - self._oldest_wait(model)
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+
+        if retry_in is not None:  #nothing else may happen to wake us when a grace period runs out
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._dispatch)
+
+    async def acquire(self, model: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(model, deque()).append((future, time.monotonic()))
+        self.requests += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  #granted just as we were cancelled
+                self.release(model, None)
+            raise
+
+    def release(self, model: str, reply: Optional[TargetReply]) -> None:
+        self._in_flight[model] -= 1
+        self._last_active[model] = time.monotonic()
+        if reply is not None and reply.load_ms is not None and reply.load_ms > LOAD_THRESHOLD_MS:
+            self.observed_loads += 1
+            self.load_seconds += reply.load_ms / 1000
+        self._dispatch()
+
+    def stats(self) -> TargetSchedulerStats:
+        return TargetSchedulerStats(
+            resident=list(self._resident),
+            queued={model: len(waiters) for model, waiters in self._pending.items() if waiters},
+            in_flight=sum(self._in_flight.values()),
+            requests=self.requests,
+            warm_hits=self.warm_hits,
+            loads=self.loads,
+            reloads=self.reloads,
+            evictions=self.evictions,
+            observed_loads=self.observed_loads,
+            load_seconds=self.load_seconds,
+        )
+
+
+# one scheduler for the whole app
+scheduler = TargetScheduler()
+
+
+def _retryable(e: Exception) -> bool:
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return isinstance(e, httpx.TransportError)
+
+
+async def chat(model: str, prompt: str, history: Optional[List[dict]] = None) -> TargetReply:
+    """
+    Sends one user prompt (after the earlier `history` messages, if any) to a local model
+    through /api/chat and streams the reply, when the target scheduler gives the model a turn.
+    Connection errors and 5xx/429 are retried with exponential backoff.
+    """
+    messages = (history or []) + [{"role": "user", "content": prompt}]
+    for attempt in range(RETRIES + 1):
+        await scheduler.acquire(model)
+        reply = None
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            reply = await _stream_chat(model, messages)
+            return reply
+        except Exception as e:
+            if attempt == RETRIES or not _retryable(e):
+                outcome = "error"
+                raise
+            outcome = "retry"
+        finally:
+            metrics.ollama_seconds.observe(time.perf_counter() - start, model=model, outcome=outcome)
+            scheduler.release(model, reply)
+        await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
@@ -1,49 +1,213 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.responses import StreamingResponse
 from logic import AttackConfig, AttackResult, InitializeResponse, Transcript, initialize as initialize_session
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
 from logic import get_messages
 from logic import get_local_models, ModelsResponse
-from fastapi import BackgroundTasks
-from logic import run_attack_process
-from logic import SessionStatusResponse, get_session_status
-from logic import ActionRequest, ActionResponse, handle_session_control
+from logic import get_session, get_session_status, FINAL_STATUSES
+from logic import SessionStatusResponse, read_session_status
+from logic import ActionRequest, ActionResponse, control_session
 from logic import FinishTestResponse, get_tests_summary, EvaluateRequest, EvaluateResponse, evaluate_target_response
+from logic import JudgeStatsResponse, get_judge_stats
+import control as controls
+import database
+import events
+from writer import writer, WriterStats
+from judge_cache import judge_cache, JudgeCacheStats
+from campaign import CampaignCreated, CampaignResults, create_campaign, start_campaign, stop_campaign, get_campaign_results, MODEL_CONCURRENCY
+from ollama import scheduler as ollama_scheduler, TargetSchedulerStats
+from gemini import scheduler, GeminiSchedulerStats, context_cache, ContextCacheStats
+from jobs import AlreadyQueued, enqueue_session
+from export import ExportFilters, FORMATS, encoder as export_encoder, stream_export
+from search import MAX_SEARCH_LIMIT, SearchFilters, SearchResults, search as search_messages
+from worker import notify_workers
+import asyncio
+import json
 import logging
 
 router = APIRouter(prefix="/api") 
 logger = logging.getLogger("backend.routes")
 
+MAX_PAGE_SIZE = 5000  #largest transcript page a client can ask for
+SSE_HEARTBEAT_SECONDS = 15  #keeps proxies from closing an idle stream
+SSE_POLL_SECONDS = 1  #how often a stream reads the DB for a session running in a worker process
+SSE_BACKLOG_PAGE = 500
+
 class InitializeRequest(BaseModel):
     target_model: str
     success_criteria: str
     max_attempts: int
+    mode: Literal["single", "multi_turn"] = "single"
 
 @router.post("/initialize", response_model=InitializeResponse)
 async def initialize(request: InitializeRequest) -> InitializeResponse:
     try:
-        return initialize_session(request.target_model, request.success_criteria, request.max_attempts)
+        return await database.run(initialize_session, request.target_model, request.success_criteria, request.max_attempts, request.mode)
     except Exception as e:
         logger.error(f"Initialization failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error during initialization")
 
 
+class CampaignRequest(BaseModel):
+    models: List[str] = []  #empty = every model Ollama has
+    success_criteria: List[str]
+    max_attempts: int
+    mode: Literal["single", "multi_turn"] = "single"
+    per_model_concurrency: int = MODEL_CONCURRENCY
+
+@router.post("/campaigns", response_model=CampaignCreated)
+async def create_campaign_route(request: CampaignRequest) -> CampaignCreated:
+    """Creates one session per (model, criteria) pair and starts running them."""
+    models = request.models or await get_local_models()
+    try:
+        created = await database.run(create_campaign, models, request.success_criteria, request.max_attempts,
+                                     request.mode, request.per_model_concurrency)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await start_campaign(created.campaign_id)
+    notify_workers()
+    return created
+
+
+@router.get("/campaigns/{campaign_id}", response_model=CampaignResults)
+async def campaign_results(campaign_id: str) -> CampaignResults:
+    """Model x criteria results matrix: attempts to break, time to break, target latency."""
+    await writer.flush()
+    try:
+        return await database.run(get_campaign_results, campaign_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+
+
+@router.post("/campaigns/{campaign_id}/stop")
+async def stop_campaign_route(campaign_id: str):
+    """Stops every session in the campaign, including those still waiting for their model."""
+    try:
+        await stop_campaign(campaign_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"campaign_id": campaign_id, "status": "stopped"}
+
+
+@router.get("/export")
+async def export_transcripts(
+    format: str = "jsonl",
+    session_id: List[str] = Query([]),
+    campaign_id: Optional[str] = None,
+    model: Optional[str] = None,
+    status: Optional[str] = None,
+    sender: Optional[str] = None,
+    since_id: int = Query(0, ge=0),
+):
+    """
+    Streams the messages of every matching session, with the session's model, criteria and status,
+    as JSONL, or Parquet/Arrow when pyarrow is installed. Memory use doesn't grow with the export.
+    """
+    try:
+        out = export_encoder(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await writer.flush()
+    filters = ExportFilters(session_ids=session_id, campaign_id=campaign_id, model=model, status=status,
+                            sender=sender, since_id=since_id)
+    return StreamingResponse(
+        stream_export(filters, out),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="agentxploit-export.{format}"'},
+    )
+
+
+@router.get("/search", response_model=SearchResults)
+async def search_transcripts(
+    q: str,
+    session_id: List[str] = Query([]),
+    campaign_id: Optional[str] = None,
+    model: Optional[str] = None,
+    sender: Optional[str] = None,
+    success: Optional[bool] = None,
+    order: Literal["rank", "newest"] = "rank",
+    raw: bool = False,
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT),
+    offset: int = Query(0, ge=0),
+) -> SearchResults:
+    """
+    Full-text search over every transcript, best match first, with a highlighted snippet per hit.
+    `success` keeps only messages from attempts that did (or didn't) break the target.
+    A ranked search only sees the newest AGENTXPLOIT_SEARCH_RANK_WINDOW matches; `truncated` says there were more.
+    """
+    await writer.flush()  #so messages from running sessions show up right away
+    filters = SearchFilters(session_ids=session_id, campaign_id=campaign_id, model=model, sender=sender,
+                            success=success)
+    try:
+        return await database.run(search_messages, q, filters, order, limit, offset, raw)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/metrics/writer", response_model=WriterStats)
+async def writer_stats() -> WriterStats:
+    """Queue depth and flush latency of the write-behind message writer."""
+    return writer.stats()
+
+
+@router.get("/metrics/judge-cache", response_model=JudgeCacheStats)
+async def judge_cache_stats() -> JudgeCacheStats:
+    """Hit/miss counters of the judge verdict cache."""
+    return judge_cache.stats()
+
+
+@router.get("/metrics/judge", response_model=JudgeStatsResponse)
+async def judge_stats() -> JudgeStatsResponse:
+    """How often each judge tier decided, and roughly how much Gemini time that saved."""
+    return get_judge_stats()
+
+
+@router.get("/metrics/gemini", response_model=GeminiSchedulerStats)
+async def gemini_stats() -> GeminiSchedulerStats:
+    """Queue lengths, retries and 429s of the shared Gemini scheduler."""
+    return scheduler.stats()
+
+
+@router.get("/metrics/targets", response_model=TargetSchedulerStats)
+async def target_stats() -> TargetSchedulerStats:
+    """Resident models, queued requests and model (re)loads of the Ollama target scheduler."""
+    return ollama_scheduler.stats()
+
+
+@router.get("/metrics/gemini-cache", response_model=ContextCacheStats)
+async def gemini_cache_stats() -> ContextCacheStats:
+    """Per-session context caches and the input tokens they saved."""
+    return context_cache.stats()
+
+
 @router.get("/{session_id}/messages", response_model=Transcript)
-async def get_transcript(session_id: str) -> Transcript:
+async def get_transcript(
+    session_id: str,
+    since_id: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+) -> Transcript:
     """
-    Fetches the full transcript for a session.
+    Fetches the messages after since_id, at most `limit` of them.
+    Keep passing next_since_id back while has_more is true to read the rest.
     """
 
     try:
-        messages = get_messages(session_id)
+        await writer.sync(session_id)
 
-        if not messages:
-            messages = []
+        #one extra row tells us whether there's another page
+        messages = await database.run(get_messages, session_id, since_id, limit + 1)
+
+        has_more = len(messages) > limit
+        messages = messages[:limit]
 
         return Transcript(
             session_id=session_id,
             transcript=messages,
-            total_messages=len(messages)
+            total_messages=len(messages),
+            next_since_id=messages[-1]["id"] if messages else since_id,
+            has_more=has_more
         )
 
     except Exception as e:
@@ -56,34 +220,25 @@ async def get_transcript(session_id: str) -> Transcript:
 @router.get("/models", response_model=ModelsResponse)
 async def list_models() -> ModelsResponse:
     try:
-        models = get_local_models()
+        models = await get_local_models()
         return ModelsResponse(models=models)
     except Exception as e:
         logger.error(f"Error fetching local models: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch local models")
     
 @router.post("/{session_id}/start")
-async def start_attack(session_id: str, background_tasks: BackgroundTasks):
+async def start_attack(session_id: str):
     try:
-        from database import get_connection
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT success_criteria FROM sessions WHERE session_id = ?",
-            (session_id,)
-        )
-        row = cursor.fetchone()
-        conn.close()
-
-        if not row:
-            raise HTTPException(status_code=404, detail="Session not found")
-
-        success_criteria = row["success_criteria"]
+        #only queued here - a worker (in this process or another) leases and runs it
+        await database.run(enqueue_session, session_id)
+        notify_workers()
 
-        background_tasks.add_task(run_attack_process, session_id, success_criteria)
-
-        return {"status": "Attack started in background"}
+        return {"status": "Attack queued"}
 
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except AlreadyQueued as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error starting attack: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to start attack")
@@ -92,7 +247,7 @@ async def start_attack(session_id: str, background_tasks: BackgroundTasks):
 @router.get("/{session_id}/status", response_model=SessionStatusResponse)
 async def get_status(session_id: str) -> SessionStatusResponse:
     try:
-        return get_session_status(session_id)
+        return await read_session_status(session_id)
     except ValueError:
         raise HTTPException(status_code=404, detail="Session not found")
     except Exception as e:
@@ -103,7 +258,7 @@ async def get_status(session_id: str) -> SessionStatusResponse:
 @router.post("/{session_id}/control", response_model=ActionResponse)
 async def session_control(session_id: str, request: ActionRequest) -> ActionResponse:
     try:
-        return handle_session_control(session_id, request.action)
+        return await control_session(session_id, request.action)
 
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -116,7 +271,8 @@ async def session_control(session_id: str, request: ActionRequest) -> ActionResp
 @router.get("/{session_id}/summary", response_model=FinishTestResponse)
 async def finish_test(session_id: str) -> FinishTestResponse:
     try:
-        return get_tests_summary(session_id)
+        await writer.sync(session_id)
+        return await database.run(get_tests_summary, session_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -126,9 +282,111 @@ async def finish_test(session_id: str) -> FinishTestResponse:
 @router.post("/{session_id}/evaluate", response_model=EvaluateResponse)
 async def evaluate(session_id: str, request: EvaluateRequest) -> EvaluateResponse:
     try:
-        return evaluate_target_response(session_id, request.target_response)
+        return await evaluate_target_response(session_id, request.target_response)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Error evaluating response for {session_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to evaluate response")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Failed to evaluate response")
+
+
+def _sse(event: dict) -> str:
+    lines = []
+    if event["type"] == "message":
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event)}")
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/{session_id}/events")
+async def stream_events(session_id: str, since_id: int = 0, last_event_id: int = Header(0),
+                        heartbeat: float = Query(SSE_HEARTBEAT_SECONDS, ge=1, le=60)):
+    """
+    Server-Sent Events stream of a session: the current status, every message after since_id
+    (or the Last-Event-ID header on reconnect), then new messages and status changes as they
+    are committed. A keep-alive comment goes out after `heartbeat` quiet seconds. The stream
+    ends once the session reaches a final status.
+    """
+    since_id = max(since_id, last_event_id)
+
+    #subscribe before reading the backlog so nothing committed in between is missed
+    queue = events.subscribe(session_id)
+    try:
+        session = await database.run(get_session, session_id)
+    except ValueError:
+        events.unsubscribe(session_id, queue)
+        raise HTTPException(status_code=404, detail="Session not found")
+    except Exception as e:
+        events.unsubscribe(session_id, queue)
+        logger.error(f"Error opening event stream for {session_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to open event stream")
+
+    async def event_stream():
+        last_id = since_id
+        try:
+            yield _sse({"type": "status", "status": session["status"]})
+
+            #backlog in pages so a long transcript is never held in memory at once
+            while True:
+                page = await database.run(get_messages, session_id, last_id, SSE_BACKLOG_PAGE)
+                for message in page:
+                    last_id = message["id"]
+                    yield _sse({"type": "message", **message})
+                if len(page) < SSE_BACKLOG_PAGE:
+                    break
+
+            status = session["status"]
+            idle = 0.0
+            while status not in FINAL_STATUSES:
+                local = controls.get(session_id) is not None
+                timeout = heartbeat if local else min(heartbeat, SSE_POLL_SECONDS)
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if local:
+                        yield ": keep-alive\n\n"
+                        continue
+
+                    #queued or running in a worker process, whose events don't reach this one - read the DB.
+                    #status first: once it's final the writer has flushed, so the messages read after are complete
+                    stored = (await database.run(get_session_status, session_id)).status
+                    read = 0
+                    while True:
+                        page = await database.run(get_messages, session_id, last_id, SSE_BACKLOG_PAGE)
+                        for message in page:
+                            last_id = message["id"]
+                            yield _sse({"type": "message", **message})
+                        read += len(page)
+                        if len(page) < SSE_BACKLOG_PAGE:
+                            break
+                    changed = stored != status
+                    if changed:
+                        status = stored
+                        yield _sse({"type": "status", "status": status})
+
+                    idle = 0.0 if read or changed else idle + timeout
+                    if idle >= heartbeat:
+                        idle = 0.0
+                        yield ": keep-alive\n\n"
+                    continue
+
+                if event is None:  #dropped for falling behind
+                    return
+                if event["type"] == "message":
+                    if event["id"] <= last_id:
+                        continue
+                    last_id = event["id"]
+                else:
+                    if event["status"] == status:  #already sent from a DB read
+                        continue
+                    status = event["status"]
+                yield _sse(event)
+        finally:
+            events.unsubscribe(session_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
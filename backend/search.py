@@ -0,0 +1,180 @@
+"""
+Full-text search over every transcript, backed by the messages_fts FTS5 index (database.py keeps
+it in step with messages through triggers).
+
+    python search.py "ignore previous instructions" [--sender attacker] [--model M] [--success]
+
+By default every word of the query has to appear (a trailing * matches a prefix); with raw=True
+the query is passed to FTS5 as is, for OR / NOT / NEAR / "phrases".
+"""
+import os
+import re
+import sqlite3
+import sys
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel
+
+import database
+from database import db
+
+MAX_SEARCH_LIMIT = 200
+SEARCH_RANK_WINDOW = int(os.environ.get("AGENTXPLOIT_SEARCH_RANK_WINDOW", "5000"))  #newest matches a ranked search scores
+SNIPPET_TOKENS = 16  #words of context around the match
+SNIPPET_MARKS = ("<mark>", "</mark>")
+
+#the outcome of the attempt a message belongs to (as its prompt, response or verdict), NULL if none
+_ATTEMPT_SUCCESS = """COALESCE(
+    (SELECT success FROM attempts WHERE prompt_message_id = m.id),
+    (SELECT success FROM attempts WHERE response_message_id = m.id),
+    (SELECT success FROM attempts WHERE verdict_message_id = m.id))"""
+
+#sqlite reports a bad MATCH expression as an OperationalError like any other
+_QUERY_ERRORS = ("fts5", "syntax error", "no such column", "unterminated string")
+
+
+class SearchFilters(BaseModel):
+    session_ids: List[str] = []
+    campaign_id: Optional[str] = None
+    model: Optional[str] = None
+    sender: Optional[str] = None     #attacker, target or judge
+    success: Optional[bool] = None   #only messages from attempts that did / didn't break the target
+
+
+class SearchHit(BaseModel):
+    message_id: int
+    session_id: str
+    campaign_id: Optional[str] = None
+    target_model: str
+    sender: str
+    timestamp: str
+    success: Optional[bool] = None  #outcome of the message's attempt
+    score: Optional[float] = None   #bm25 relevance, higher is better; not computed for order=newest
+    snippet: str                    #matched words wrapped in SNIPPET_MARKS
+
+
+class SearchResults(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    has_more: bool    #for order=rank, within the ranked window
+    truncated: bool = False  #order=rank only: older matches than the newest SEARCH_RANK_WINDOW exist and aren't returned
+
+
+def match_expression(text: str) -> str:
+    """Plain words to an FTS5 query matching all of them, so punctuation can't be read as syntax."""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search(query: str, filters: SearchFilters, order: Literal["rank", "newest"] = "rank",
+           limit: int = 20, offset: int = 0, raw: bool = False) -> SearchResults:
+    """
+    Messages matching `query`, best match (or newest) first. Ranking covers the newest SEARCH_RANK_WINDOW
+    matches, so it is exact unless a query matches more messages than that - then older matches are
+    never returned, has_more ends with the window and `truncated` is set; order=newest or a narrower
+    query reaches them. ValueError for an empty or malformed query.
+    """
+    expression = query.strip() if raw else match_expression(query)
+    if not expression:
+        raise ValueError("Empty search query")
+
+    where = ["messages_fts MATCH ?"]
+    params: list = [expression]
+    source = "messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+    if filters.session_ids:
+        sessions = f"session_id IN ({', '.join('?' * len(filters.session_ids))})"
+        #a session's messages sit in a narrow band of ids - only that part of the index is read
+        where.append(f"messages_fts.rowid BETWEEN (SELECT MIN(id) FROM messages WHERE {sessions}) "
+                     f"AND (SELECT MAX(id) FROM messages WHERE {sessions})")
+        where.append(f"m.{sessions}")
+        params.extend(filters.session_ids * 3)
+    if filters.campaign_id is not None or filters.model is not None:
+        source += " JOIN sessions s ON s.session_id = m.session_id"
+    for column, value in (("s.campaign_id", filters.campaign_id), ("s.target_model", filters.model),
+                          ("m.sender", filters.sender)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if filters.success is not None:
+        where.append(f"{_ATTEMPT_SUCCESS} = ?")
+        params.append(int(filters.success))
+
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    offset = max(0, offset)
+    #scoring every match of a very common word is what makes a ranked search slow, so only the newest
+    #SEARCH_RANK_WINDOW matches are ranked; FTS5 hands them over newest first without sorting. One more
+    #is read (not ranked) to tell whether the window cut anything off
+    window = SEARCH_RANK_WINDOW if order == "rank" else limit + 1 + offset
+    page_order = "rank" if order == "rank" else "id DESC"
+    matches = f"""
+        SELECT messages_fts.rowid AS id, {"messages_fts.rank" if order == "rank" else "NULL"} AS rank
+        FROM {source}
+        WHERE {" AND ".join(where)}
+        ORDER BY messages_fts.rowid DESC
+        LIMIT ?"""
+    try:
+        with db() as conn:
+            rows = conn.execute(f"""
+                WITH matches AS MATERIALIZED ({matches}
+                ), page AS MATERIALIZED (
+                    SELECT id, rank FROM (SELECT id, rank FROM matches ORDER BY id DESC LIMIT ?)
+                    ORDER BY {page_order} LIMIT ? OFFSET ?
+                )
+                SELECT m.id AS message_id, m.session_id, s.campaign_id, s.target_model, m.sender, m.timestamp,
+                       {_ATTEMPT_SUCCESS} AS success, -page.rank AS score,
+                       snippet(messages_fts, 0, ?, ?, '…', ?) AS snippet,
+                       (SELECT COUNT(*) FROM matches) AS matched
+                FROM page
+                CROSS JOIN messages_fts ON messages_fts.rowid = page.id
+                JOIN messages m ON m.id = page.id
+                JOIN sessions s ON s.session_id = m.session_id
+                WHERE messages_fts MATCH ?
+                ORDER BY page.{page_order}
+            """, (*params, window + 1, window, limit + 1, offset, *SNIPPET_MARKS, SNIPPET_TOKENS,
+                  expression)).fetchall()
+            if rows:
+                matched = rows[0]["matched"]
+            elif order == "rank" and offset:  #paged past the end - was that the end of the window?
+                matched = conn.execute(f"SELECT COUNT(*) FROM ({matches})", (*params, window + 1)).fetchone()[0]
+            else:
+                matched = 0
+    except sqlite3.OperationalError as e:
+        if any(marker in str(e) for marker in _QUERY_ERRORS):
+            raise ValueError(f"Invalid search query: {e}")
+        raise
+
+    hits = [SearchHit(**{key: row[key] for key in row.keys() if key != "matched"}) for row in rows[:limit]]
+    return SearchResults(query=query, hits=hits, has_more=len(rows) > limit,
+                         truncated=order == "rank" and matched > window)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Search AgentXploit transcripts")
+    parser.add_argument("query")
+    parser.add_argument("--raw", action="store_true", help="pass the query to FTS5 unchanged")
+    parser.add_argument("--session", action="append", default=[], dest="session_ids")
+    parser.add_argument("--campaign")
+    parser.add_argument("--model")
+    parser.add_argument("--sender")
+    parser.add_argument("--success", action="store_true", default=None, help="only successful attempts")
+    parser.add_argument("--newest", action="store_true", help="newest first instead of best match")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    filters = SearchFilters(session_ids=args.session_ids, campaign_id=args.campaign, model=args.model,
+                            sender=args.sender, success=args.success)
+    database.create_tables()
+    try:
+        results = search(args.query, filters, "newest" if args.newest else "rank", args.limit, raw=args.raw)
+    except ValueError as e:
+        sys.exit(str(e))
+    for hit in results.hits:
+        snippet = re.sub(r"\s+", " ", hit.snippet)
+        score = f"{hit.score:7.2f}" if hit.score is not None else " " * 7
+        print(f"{hit.message_id:>9} {hit.session_id} {hit.sender:<8} {score}  {snippet}")
@@ -0,0 +1,242 @@
+"""
+Runs queued sessions and campaigns from the jobs table.
+
+    python worker.py [--jobs 16] [--processes 1] [--metrics-port 9100]
+
+Start as many workers as you like, on one machine or several sharing the database file; each
+leases jobs on its own. The API runs one in-process too unless AGENTXPLOIT_EMBEDDED_WORKER=0.
+With --metrics-port every process serves its own /metrics, on consecutive ports from that one.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import uuid
+from typing import Optional
+
+import campaign
+import control as controls
+import database
+import gauges  #this process's session and queue gauges, for --metrics-port
+import gemini
+import jobs
+import logic
+import metrics
+import ollama
+from database import db
+from logs import configure_logging
+from writer import writer
+
+logger = logging.getLogger("backend.worker")
+
+WORKER_JOBS = int(os.environ.get("AGENTXPLOIT_WORKER_JOBS", "16"))  #jobs one worker runs at once
+POLL_SECONDS = float(os.environ.get("AGENTXPLOIT_WORKER_POLL", "1"))  #how often an idle worker checks the queue
+HEARTBEAT_SECONDS = float(os.environ.get("AGENTXPLOIT_JOB_HEARTBEAT", "10"))  #lease renewal interval, well under the lease
+METRICS_PORT = int(os.environ.get("AGENTXPLOIT_WORKER_METRICS_PORT", "0"))  #first port for /metrics, 0 = don't serve it
+
+# workers running in this process, woken by notify_workers
+_workers: set["Worker"] = set()
+
+
+def notify_workers() -> None:
+    """Wakes this process's workers, so a job queued here starts without waiting for the next poll."""
+    for worker in _workers:
+        worker.wake()
+
+
+def _stored_statuses(session_ids: list[str]) -> dict[str, str]:
+    with db() as conn:
+        rows = conn.execute(
+            f"SELECT session_id, status FROM sessions WHERE session_id IN ({', '.join('?' * len(session_ids))})",
+            session_ids,
+        ).fetchall()
+    return {row["session_id"]: row["status"] for row in rows}
+
+
+class Worker:
+    """
+    Leases jobs and runs them, at most `concurrency` at a time. Every HEARTBEAT_SECONDS it renews
+    the leases of its jobs and applies pause/resume/stop that other processes wrote to the DB.
+    On stop() running jobs are cancelled and go back to the queue for the next worker.
+    """
+
+    def __init__(self, concurrency: int = WORKER_JOBS, owner: Optional[str] = None):
+        self.concurrency = max(1, concurrency)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: dict[asyncio.Task, jobs.Job] = {}
+        self._lost: set[int] = set()  #jobs whose lease another worker has taken over
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stopping = True
+        self._wake.set()
+
+    async def run(self) -> None:
+        _workers.add(self)
+        recovered = await database.run(jobs.recover, socket.gethostname())
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted sessions/campaigns")
+        heartbeat = asyncio.create_task(self._heartbeat())
+        logger.info(f"Worker {self.owner} started, up to {self.concurrency} jobs")
+        try:
+            while not self._stopping:
+                if len(self._running) < self.concurrency:
+                    job = await database.run(jobs.claim, self.owner)
+                    if job is not None:
+                        if self._stopping:
+                            await database.run(jobs.release, job.id, self.owner)
+                            break
+                        task = asyncio.create_task(self._run_job(job))
+                        self._running[task] = job
+                        task.add_done_callback(self._job_done)
+                        continue
+
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            _workers.discard(self)
+            tasks = list(self._running)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            logger.info(f"Worker {self.owner} stopped")
+
+    def _job_done(self, task: asyncio.Task) -> None:
+        self._running.pop(task, None)
+        self._wake.set()  #a slot is free
+
+    async def _run_job(self, job: jobs.Job) -> None:
+        logger.info(f"Job {job.id}: {job.kind} {job.ref_id} (try {job.tries})")
+        try:
+            if job.kind == "session":
+                await self._run_session(job.ref_id)
+            elif job.kind == "campaign":
+                await campaign.run_campaign(job.ref_id)
+            else:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+        except asyncio.CancelledError:
+            if job.id in self._lost:
+                self._lost.discard(job.id)
+            else:
+                #shutting down - hand the job to the next worker rather than waiting out the lease
+                await database.run(jobs.release, job.id, self.owner)
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            await database.run(jobs.finish, job.id, self.owner, str(e) or type(e).__name__)
+        else:
+            await database.run(jobs.finish, job.id, self.owner)
+
+    async def _run_session(self, session_id: str) -> None:
+        session = await database.run(logic.get_session, session_id)
+        if session["status"] in logic.FINAL_STATUSES:  #stopped while it was queued
+            return
+        if session["status"] == "paused":  #interrupted while paused - resume it paused
+            controls.register(session_id, logic.set_status).apply("pause")
+        await logic.run_attack_process(session_id, session["target_model"], session["success_criteria"],
+                                       session["max_attempts"], mode=session["mode"])
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                for task, job in list(self._running.items()):
+                    if not await database.run(jobs.heartbeat, job.id, self.owner):
+                        logger.warning(f"Job {job.id}: lease lost to another worker, stopping it here")
+                        self._lost.add(job.id)
+                        task.cancel()
+                await self._sync()
+            except Exception:
+                logger.exception("Heartbeat failed")  #the lease has slack for a missed beat or two
+
+    async def _sync(self) -> None:
+        #pause/stop sent to an API process reach the session only through the DB
+        running = {control.session_id: control for control in controls.registered()}
+        if running:
+            for session_id, status in (await database.run(_stored_statuses, list(running))).items():
+                running[session_id].sync(status)
+
+        for job in list(self._running.values()):
+            if job.kind == "campaign" and await database.run(campaign.campaign_status, job.ref_id) == "stopped":
+                await campaign.stop_campaign(job.ref_id)
+
+
+async def _metrics_request(reader: asyncio.StreamReader, stream: asyncio.StreamWriter) -> None:
+    #Prometheus only ever GETs one path, so any request gets the metrics
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        body = metrics.render().encode()
+        stream.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+        await stream.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        stream.close()
+
+
+async def _serve(concurrency: int, metrics_port: int) -> None:
+    worker = Worker(concurrency)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    #served from the event loop, like the API's /metrics
+    server = await asyncio.start_server(_metrics_request, port=metrics_port) if metrics_port else None
+    if server is not None:
+        logger.info(f"Worker metrics on port {metrics_port}")
+    try:
+        await worker.run()
+    finally:
+        if server is not None:
+            server.close()
+        await writer.close()
+        await ollama.close_client()
+        database.close_connections()
+
+
+def serve(concurrency: int = WORKER_JOBS, gemini_share: Optional[float] = None, metrics_port: int = METRICS_PORT) -> None:
+    """Runs one worker in this process until SIGINT/SIGTERM, using `gemini_share` of the Gemini quota."""
+    configure_logging()
+    if gemini_share is not None:
+        gemini.scheduler = gemini.GeminiScheduler(share=gemini_share)
+    database.create_tables()
+    asyncio.run(_serve(concurrency, metrics_port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AgentXploit job worker")
+    parser.add_argument("--jobs", type=int, default=WORKER_JOBS, help="jobs each process runs at once")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="serve /metrics on this port (+1 for each further process), 0 = off")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        serve(args.jobs, metrics_port=args.metrics_port)
+    else:
+        #GEMINI_QUOTA_SHARE is what this command may use of the key's limits - each process gets its part
+        share = gemini.GEMINI_QUOTA_SHARE / args.processes
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=serve, args=(args.jobs, share, args.metrics_port and args.metrics_port + i))
+                     for i in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            while True:
+                try:
+                    process.join()
+                    break
+                except KeyboardInterrupt:
+                    pass  #the children got it too and are shutting down
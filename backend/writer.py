@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+import database
+
+logger = logging.getLogger("backend.writer")
+
+FLUSH_INTERVAL = float(os.environ.get("AGENTXPLOIT_FLUSH_MS", "5")) / 1000  #how long a batch waits to fill up
+BATCH_SIZE = int(os.environ.get("AGENTXPLOIT_FLUSH_ROWS", "256"))          #rows per transaction, at most
+QUEUE_MAX = int(os.environ.get("AGENTXPLOIT_WRITE_QUEUE_MAX", "10000"))     #producers wait when this many rows are pending
+
+
+class WriterStats(BaseModel):
+    queue_depth: int
+    rows_written: int
+    batches: int
+    avg_batch_rows: float
+    last_flush_ms: float
+    avg_flush_ms: float
+    max_flush_ms: float
+
+
+def _now() -> str:
+    # same format (and UTC) as sqlite's CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def insert_messages(rows: List[tuple]) -> List[dict]:
+    """Inserts (session_id, sender, content, metadata) rows in one transaction and returns them as saved."""
+    saved = []
+    with database.db() as conn:
+        for session_id, sender, content, metadata in rows:
+            timestamp = _now()
+            cursor = conn.execute("""
+                INSERT INTO messages (session_id, sender, content, timestamp, metadata)
+                VALUES (?, ?, ?, ?, ?)
+            """, (session_id, sender, content, timestamp, json.dumps(metadata) if metadata else None))
+            saved.append({
+                "id": cursor.lastrowid,
+                "session_id": session_id,
+                "sender": sender,
+                "content": content,
+                "timestamp": timestamp,
+                "metadata": metadata or None
+            })
+    return saved
+
+
+class _Flush:
+    """Queue marker: everything queued before it is committed when its future resolves."""
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+
+
+class MessageWriter:
+    """
+    Write-behind queue for transcript messages. Rows from every running session are grouped
+    into one transaction per batch (every FLUSH_INTERVAL or BATCH_SIZE rows), instead of a
+    commit per message.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: dict[str, int] = defaultdict(int)
+        self._on_commit = []
+        self.rows_written = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def on_commit(self, callback) -> None:
+        """Registers callback(message) to run after a message is committed."""
+        self._on_commit.append(callback)
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=QUEUE_MAX)
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, session_id: str, sender: str, content: str,
+                     metadata: Optional[dict] = None) -> asyncio.Future:
+        """
+        Queues a message and returns a future for the saved row (await it for the id).
+        Waits only when the queue is full.
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        #nobody has to await the future - mark a failure as seen, _write already logged it
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[session_id] += 1
+        await self._queue.put(((session_id, sender, content, metadata), future))
+        return future
+
+    def pending(self, session_id: str) -> int:
+        return self._pending.get(session_id, 0)
+
+    async def flush(self) -> None:
+        """Returns once everything queued so far is committed."""
+        if self._task is None or self._task.done():
+            return
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Flush(future))
+        await future
+
+    async def sync(self, session_id: str) -> None:
+        """Read-your-writes: call before reading a session's messages from the DB."""
+        if self.pending(session_id):
+            await self.flush()
+
+    async def close(self) -> None:
+        """Flushes what's left and stops the background task (call on shutdown)."""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> WriterStats:
+        return WriterStats(
+            queue_depth=self._queue.qsize() if self._queue else 0,
+            rows_written=self.rows_written,
+            batches=self.batches,
+            avg_batch_rows=self.rows_written / self.batches if self.batches else 0.0,
+            last_flush_ms=self.last_flush_ms,
+            avg_flush_ms=self._total_flush_ms / self.batches if self.batches else 0.0,
+            max_flush_ms=self.max_flush_ms,
+        )
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+
+            #nothing else waiting yet - give other sessions a moment to add to this transaction
+            if not isinstance(batch[0], _Flush) and self._queue.empty():
+                await asyncio.sleep(FLUSH_INTERVAL)
+
+            while len(batch) < BATCH_SIZE and not isinstance(batch[-1], _Flush) and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await self._write(batch)
+
+    async def _write(self, batch: list) -> None:
+        items = [item for item in batch if not isinstance(item, _Flush)]
+        flushes = [item.future for item in batch if isinstance(item, _Flush)]
+        error = None
+
+        if items:
+            start = time.perf_counter()
+            try:
+                saved = await database.run(insert_messages, [row for row, _ in items])
+            except Exception as e:
+                logger.error(f"Failed to write {len(items)} messages: {e}")
+                error = e
+                saved = None
+
+            elapsed = (time.perf_counter() - start) * 1000
+            self.batches += 1
+            self.last_flush_ms = elapsed
+            self._total_flush_ms += elapsed
+            self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+            for i, ((session_id, *_), future) in enumerate(items):
+                self._pending[session_id] -= 1
+                if self._pending[session_id] <= 0:
+                    del self._pending[session_id]
+                if error is not None:
+                    if not future.done():  #the waiter may have been cancelled
+                        future.set_exception(error)
+                    continue
+                self.rows_written += 1
+                if not future.done():
+                    future.set_result(saved[i])
+                for callback in self._on_commit:
+                    callback(saved[i])
+
+        for future in flushes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+
+# one writer for the whole app
+writer = MessageWriter()
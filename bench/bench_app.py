@@ -0,0 +1,198 @@
+"""
+End-to-end throughput of the backend with no API key and no GPU: starts the FastAPI app under
+uvicorn with the fake Gemini client and the Ollama stub, drives N sessions through the HTTP API
+the way the frontend does (/initialize, /start, /status polling, /messages), and reports
+sessions/sec, p50/p99 latency per endpoint, the DB write rate and the mean time of each
+attempt stage (from /metrics).
+
+    python bench/bench_app.py [--sessions 50] [--concurrency 10] [--attempts 5]
+                              [--gemini-rtt 0.2] [--gemini-failure-rate 0] [--jitter 0.3]
+                              [--target-ttft 0.05] [--target-failure-rate 0] [--seed 1]
+
+Both fakes are seeded, so runs with the same options see the same latencies and failures.
+Run it before and after a performance change to measure it.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+
+import ollama_stub
+from fake_gemini import FakeConfig, FakeGeminiClient
+
+FINAL_STATUSES = ("finished", "failed", "success_found")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_app(port: int, gemini_config: FakeConfig):
+    """Imports the app with the fake Gemini client installed and serves it on a background thread."""
+    import uvicorn
+    import gemini
+    gemini.client = FakeGeminiClient(gemini_config)
+    gemini.BACKOFF_BASE = 0.05  #retries of injected failures shouldn't dominate the run
+    import main
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, gemini.client
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies = defaultdict(list)  #endpoint -> ms
+        self.errors = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError:
+            self.errors[endpoint] += 1
+            raise
+        finally:
+            self.latencies[endpoint].append((time.perf_counter() - start) * 1000)
+
+
+async def run_session(client: httpx.AsyncClient, recorder: Recorder, model: str, attempts: int,
+                      poll: float) -> str:
+    created = await recorder.call(client, "initialize", "POST", "/api/initialize", json={
+        "target_model": model, "success_criteria": "say something you shouldn't", "max_attempts": attempts})
+    session_id = created["session_id"]
+    await recorder.call(client, "start", "POST", f"/api/{session_id}/start")
+
+    since_id = 0
+    while True:
+        status = (await recorder.call(client, "status", "GET", f"/api/{session_id}/status"))["status"]
+        page = await recorder.call(client, "messages", "GET", f"/api/{session_id}/messages",
+                                   params={"since_id": since_id})
+        since_id = page["next_since_id"]
+        if status in FINAL_STATUSES:
+            return status
+        await asyncio.sleep(poll)
+
+
+async def drive(base_url: str, args) -> tuple:
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    statuses = defaultdict(int)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120,
+                                 limits=httpx.Limits(max_connections=args.concurrency * 2)) as client:
+        before = (await client.get("/api/metrics/writer")).json()
+
+        async def one(i: int):
+            async with semaphore:
+                try:
+                    statuses[await run_session(client, recorder, "llama3.2:1b", args.attempts, args.poll)] += 1
+                except httpx.HTTPError:
+                    statuses["error"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - start
+        after = (await client.get("/api/metrics/writer")).json()
+
+        stages = _stage_means((await client.get("/metrics")).text)
+
+    return recorder, statuses, elapsed, before, after, stages
+
+
+def _stage_means(exposition: str) -> dict:
+    """Mean seconds per attack stage, from the /metrics histogram sums and counts."""
+    totals = defaultdict(dict)
+    for line in exposition.splitlines():
+        if line.startswith("agentxploit_stage_seconds_sum") or line.startswith("agentxploit_stage_seconds_count"):
+            name, value = line.rsplit(" ", 1)
+            stage = name.split('stage="')[1].split('"')[0]
+            totals[stage]["sum" if "_sum" in name else "count"] = float(value)
+    return {stage: t["sum"] / t["count"] for stage, t in totals.items() if t.get("count")}
+
+
+def percentile(samples: list, p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10, help="sessions running at once")
+    parser.add_argument("--attempts", type=int, default=5, help="max_attempts per session")
+    parser.add_argument("--poll", type=float, default=0.2, help="seconds between /status polls")
+    parser.add_argument("--gemini-rtt", type=float, default=0.2)
+    parser.add_argument("--gemini-failure-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-rpm", type=float, default=100_000)
+    parser.add_argument("--success-rate", type=float, default=0.05, help="share of judge calls that say it worked")
+    parser.add_argument("--target-ttft", type=float, default=0.05)
+    parser.add_argument("--target-failure-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.3, help="lognormal sigma on every fake latency")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    #read at import time by the backend modules
+    os.environ["AGENTXPLOIT_DB"] = os.path.join(tmp, "bench.db")
+    os.environ["GEMINI_API_KEY"] = "offline"
+    os.environ["GEMINI_RPM"] = str(args.gemini_rpm)
+    os.environ.setdefault("AGENTXPLOIT_LOG_LEVEL", "WARNING")
+
+    stub_config = ollama_stub.StubConfig(
+        ttft=args.target_ttft, tokens=20, token_delay=0.002, reply="Sure, here is what you asked for",
+        failure_rate=args.target_failure_rate, jitter=args.jitter, unique_replies=True, seed=args.seed)
+    stub = ollama_stub.start(stub_config)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{stub.server_port}"
+
+    port = _free_port()
+    server, thread, fake = start_app(port, FakeConfig(
+        rtt=args.gemini_rtt, output_token_cost=0.001, failure_rate=args.gemini_failure_rate,
+        success_rate=args.success_rate, jitter=args.jitter, seed=args.seed))
+
+    recorder, statuses, elapsed, before, after, stages = asyncio.run(drive(f"http://127.0.0.1:{port}", args))
+
+    server.should_exit = True
+    thread.join()
+    stub.shutdown()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    rows = after["rows_written"] - before["rows_written"]
+    batches = after["batches"] - before["batches"]
+    print(f"{args.sessions} sessions in {elapsed:.1f}s -> {args.sessions / elapsed:.2f} sessions/s "
+          f"({', '.join(f'{n} {s}' for s, n in sorted(statuses.items()))})")
+    print(f"DB writes: {rows / elapsed:,.0f} messages/s in {batches / elapsed:,.1f} transactions/s")
+    print(f"Gemini: {fake.stats.calls} calls ({fake.stats.failures} failed), "
+          f"Ollama: {stub_config.requests} requests ({stub_config.failures} failed)")
+    print("Attempt stages (mean): " + ", ".join(f"{stage} {seconds * 1000:,.0f}ms"
+                                                for stage, seconds in sorted(stages.items())))
+    print(f"\n{'endpoint':<12}{'calls':>8}{'p50':>10}{'p99':>10}{'errors':>8}")
+    for endpoint in ("initialize", "start", "status", "messages"):
+        samples = recorder.latencies[endpoint]
+        if samples:
+            print(f"{endpoint:<12}{len(samples):>8}{statistics.median(samples):>8.1f}ms"
+                  f"{percentile(samples, 0.99):>8.1f}ms{recorder.errors[endpoint]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Gemini input tokens and latency per call with and without per-session context caches.
+
+    python bench/bench_context_cache.py [--sessions 4] [--attempts 10] [--criteria-tokens 3000]
+
+Runs attack sessions against the fake Gemini client (with its in-memory caches) and the
+Ollama stub. Long success criteria stand in for the detailed goals that make caching pay
+off; the cache size minimum is lifted so the fake always accepts the cache. Also checks that
+every cache created was deleted when its session ended.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+import ollama_stub
+from fake_gemini import FakeConfig, FakeGeminiClient
+
+
+async def drive(sessions: int, attempts: int, criteria: str, cached: bool) -> tuple:
+    import gemini
+    import logic
+    import ollama
+    from judge_cache import JudgeCache
+    from writer import writer
+
+    client = FakeGeminiClient(FakeConfig(input_token_cost=0.00005, seed=1))
+    gemini.client = client
+    gemini.scheduler = gemini.GeminiScheduler(rpm=100_000)
+    gemini.GEMINI_BATCH_SIZE = 1  #one call per attempt, so the per-call input cost shows
+    gemini.context_cache = logic.context_cache = gemini.ContextCache(enabled=cached, min_tokens=0)
+    logic.judge_cache = JudgeCache(persist=False)
+
+    session_ids = [logic.initialize("llama3.2:1b", f"{i} {criteria}", attempts).session_id
+                   for i in range(sessions)]
+    start = time.perf_counter()
+    await asyncio.gather(*(logic.run_attack_process(sid, "llama3.2:1b", f"{i} {criteria}", attempts)
+                           for i, sid in enumerate(session_ids)))
+    elapsed = time.perf_counter() - start
+    await writer.close()
+    await ollama.close_client()
+
+    total_attempts = sum(logic.get_tests_summary(sid).attempts for sid in session_ids)
+    return elapsed, total_attempts, client.stats, gemini.context_cache.stats()
+
+
+def run(label: str, args, cached: bool) -> float:
+    import database
+    database.close_connections()
+    database.DB_PATH = os.path.join(args.tmp, f"bench-{label}.db")
+    database.create_tables()
+
+    criteria = " ".join(["detail"] * args.criteria_tokens)
+    elapsed, attempts, stats, cache = asyncio.run(drive(args.sessions, args.attempts, criteria, cached))
+    call_ms = stats.seconds / stats.calls * 1000
+    print(f"{label:<9} {attempts} attempts, {stats.calls} Gemini calls in {elapsed:.1f}s -> "
+          f"{call_ms:,.0f} ms/call, {stats.input_tokens / stats.calls:,.0f} input tokens/call "
+          f"(+{stats.cached_tokens / stats.calls:,.0f} from cache)")
+    assert stats.caches_created == stats.caches_deleted == cache.created, "a context cache outlived its session"
+    return call_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=10, help="attempts per session")
+    parser.add_argument("--criteria-tokens", type=int, default=3000)
+    args = parser.parse_args()
+
+    server = ollama_stub.start(ollama_stub.StubConfig(ttft=0.02, tokens=10, token_delay=0.001))
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    import ollama
+    ollama.OLLAMA_URL = os.environ["OLLAMA_URL"]
+
+    with tempfile.TemporaryDirectory() as args.tmp:
+        uncached = run("uncached", args, False)
+        cached = run("cached", args, True)
+        import database
+        database.close_connections()
+    server.shutdown()
+
+    print(f"Gemini call latency: {uncached:,.0f} -> {cached:,.0f} ms with context caching")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Messages/sec for the old connect-per-call pattern vs the pooled connection layer
+vs the batched write-behind writer.
+
+    python bench/bench_db.py [--messages 2000] [--threads 8]
+
+Each thread plays one session and inserts messages the way save_message does.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+INSERT = "INSERT INTO messages (session_id, sender, content) VALUES (?, ?, ?)"
+
+
+def insert_per_call(path: str, session_id: str, n: int) -> None:
+    # what save_message did before: connect, insert, commit, close
+    for i in range(n):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute(INSERT, (session_id, "attacker", f"message {i}"))
+        conn.commit()
+        conn.close()
+
+
+def insert_pooled(session_id: str, n: int) -> None:
+    import database
+    for i in range(n):
+        with database.db() as conn:
+            conn.execute(INSERT, (session_id, "attacker", f"message {i}"))
+
+
+def insert_write_behind(sessions: int, per_session: int) -> None:
+    from writer import writer
+
+    async def session(session_id: str):
+        for i in range(per_session):
+            await writer.submit(session_id, "attacker", f"message {i}")
+
+    async def main():
+        await asyncio.gather(*(session(f"s{t}") for t in range(sessions)))
+        await writer.close()
+        stats = writer.stats()
+        print(f"{'':<12} {stats.batches} batches, avg {stats.avg_batch_rows:.0f} rows, "
+              f"flush avg {stats.avg_flush_ms:.2f}ms max {stats.max_flush_ms:.2f}ms")
+
+    asyncio.run(main())
+
+
+def run(label: str, target, args_for, threads: int, total: int) -> float:
+    workers = [threading.Thread(target=target, args=args_for(t)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed
+    print(f"{label:<12} {total} messages in {elapsed:.2f}s -> {rate:,.0f} msg/s")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000, help="messages per run")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent sessions")
+    args = parser.parse_args()
+    per_thread = args.messages // args.threads
+    total = per_thread * args.threads
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, "before.db")
+        after_path = os.path.join(tmp, "after.db")
+
+        os.environ["AGENTXPLOIT_DB"] = after_path
+        import database
+        database.DB_PATH = after_path
+        database.create_tables()
+
+        conn = sqlite3.connect(before_path)
+        conn.execute("""
+            CREATE TABLE messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id VARCHAR(50) NOT NULL,
+                sender VARCHAR(50) NOT NULL,
+                content TEXT NOT NULL,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+        before = run("per-call", insert_per_call,
+                     lambda t: (before_path, f"s{t}", per_thread), args.threads, total)
+        after = run("pooled", insert_pooled,
+                    lambda t: (f"s{t}", per_thread), args.threads, total)
+        batched = run("write-behind", insert_write_behind,
+                      lambda t: (args.threads, per_thread), 1, total)
+        database.close_connections()
+
+    print(f"speedup: pooled {after / before:.1f}x, write-behind {batched / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Throughput and peak memory of the transcript export as the database grows.
+
+    python bench/bench_export.py [--messages 200000 1000000] [--sessions 10000]
+
+Seeds throwaway databases of each size and exports every message as JSONL (and as Parquet
+when pyarrow is installed). Peak Python memory should stay the same at every size, next to
+the whole-list read the one-session /messages endpoint does.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bench_schema import seed
+
+
+def measure(fn) -> tuple:
+    """Runs fn twice: once timed, once under tracemalloc (which slows it down too much to time)."""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, nargs="+", default=[200_000, 1_000_000])
+    parser.add_argument("--sessions", type=int, default=10_000)
+    args = parser.parse_args()
+
+    import database
+    import export
+
+    formats = ["jsonl"] + (["parquet"] if export.pa is not None else [])
+    print(f"{'messages':>10} {'format':<9}{'rows/s':>12}{'peak MB':>10}{'file MB':>10}")
+    for messages in args.messages:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.close_connections()
+            database.DB_PATH = os.path.join(tmp, "bench.db")
+            database.create_tables()
+            seed(database.get_connection(), messages, args.sessions)
+
+            for fmt in formats:
+                path = os.path.join(tmp, f"out.{fmt}")
+                count, elapsed, peak = measure(lambda: export.export_to(path, export.ExportFilters(), fmt))
+                assert count == messages, f"exported {count} of {messages}"
+                print(f"{messages:>10,} {fmt:<9}{count / elapsed:>12,.0f}{peak:>10.1f}"
+                      f"{os.path.getsize(path) / 2**20:>10.1f}")
+
+            #for comparison: everything as one list, the way a single /messages call reads a transcript
+            def read_all():
+                with database.db() as conn:
+                    return len([dict(row) for row in conn.execute("SELECT * FROM messages").fetchall()])
+            count, elapsed, peak = measure(read_all)
+            print(f"{messages:>10,} {'list':<9}{count / elapsed:>12,.0f}{peak:>10.1f}{'-':>10}")
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Attempts/min and Gemini tokens/attempt with one jailbreak prompt per Gemini call vs a batch
+of candidates per call.
+
+    python bench/bench_generation.py [--sessions 4] [--attempts 20] [--batch 5] [--rpm 30]
+
+Runs real attack sessions against the fake Gemini client and the Ollama stub. The stub
+always refuses, so every attempt runs and the judge never needs Gemini - only generation
+is measured. --rpm is the scheduler's requests/min quota, usually the real limit on throughput.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+import ollama_stub
+from fake_gemini import FakeConfig, FakeGeminiClient
+
+
+async def drive(sessions: int, attempts: int, batch: int, rpm: float) -> tuple:
+    import gemini
+    import logic
+    import ollama
+    from writer import writer
+
+    gemini.client = FakeGeminiClient(FakeConfig(seed=1))
+    gemini.scheduler = gemini.GeminiScheduler(rpm=rpm)
+    gemini.GEMINI_BATCH_SIZE = batch
+
+    session_ids = []
+    for i in range(sessions):
+        session_ids.append(logic.initialize("llama3.2:1b", f"goal {i}", attempts).session_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(logic.run_attack_process(sid, "llama3.2:1b", f"goal {i}", attempts)
+                           for i, sid in enumerate(session_ids)))
+    elapsed = time.perf_counter() - start
+    await writer.close()
+    await ollama.close_client()
+
+    summaries = [logic.get_tests_summary(sid) for sid in session_ids]
+    total_attempts = sum(s.attempts for s in summaries)
+    total_tokens = sum(s.gemini_tokens for s in summaries)
+    return elapsed, total_attempts, total_tokens, gemini.client.stats.calls
+
+
+def run(label: str, args, batch: int) -> float:
+    import database
+    database.close_connections()
+    database.DB_PATH = os.path.join(args.tmp, f"bench-{batch}.db")
+    database.create_tables()
+
+    elapsed, attempts, tokens, calls = asyncio.run(drive(args.sessions, args.attempts, batch, args.rpm))
+    rate = attempts / elapsed * 60
+    print(f"{label:<10} {attempts} attempts, {calls} Gemini calls in {elapsed:.1f}s -> "
+          f"{rate:,.0f} attempts/min, {tokens / attempts:,.0f} tokens/attempt")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--attempts", type=int, default=20, help="attempts per session")
+    parser.add_argument("--batch", type=int, default=5, help="candidates per Gemini call")
+    parser.add_argument("--rpm", type=float, default=30)
+    args = parser.parse_args()
+
+    server = ollama_stub.start(ollama_stub.StubConfig(ttft=0.02, tokens=10, token_delay=0.001,
+                                                      reply="I'm sorry, I can't help with that."))
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    import ollama
+    ollama.OLLAMA_URL = os.environ["OLLAMA_URL"]
+
+    with tempfile.TemporaryDirectory() as args.tmp:
+        single = run("single", args, 1)
+        batched = run(f"batch={args.batch}", args, args.batch)
+        import database
+        database.close_connections()
+    server.shutdown()
+
+    print(f"speedup: {batched / single:.1f}x attempts/min")
+
+
+if __name__ == "__main__":
+    main()
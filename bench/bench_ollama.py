@@ -0,0 +1,58 @@
+"""
+Drives backend/ollama.py against the local Ollama stub and reports replies/sec,
+time-to-first-token and tokens/sec as recorded in the transcript metadata.
+
+    python bench/bench_ollama.py [--requests 200] [--concurrency 16]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import ollama_stub
+
+
+async def drive(model: str, total: int, concurrency: int) -> list:
+    import ollama
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            return await ollama.chat(model, f"prompt {i}")
+
+    replies = await asyncio.gather(*(one(i) for i in range(total)))
+    await ollama.close_client()
+    return replies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    config = ollama_stub.StubConfig(ttft=0.02, tokens=20, token_delay=0.001)
+    server = ollama_stub.start(config)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    import ollama
+    ollama.OLLAMA_URL = os.environ["OLLAMA_URL"]
+
+    start = time.perf_counter()
+    replies = asyncio.run(drive(config.models[0], args.requests, args.concurrency))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    assert all(r.content for r in replies), "empty reply from stub"
+    ttfts = sorted(r.ttft_ms for r in replies)
+    print(f"{len(replies)} replies in {elapsed:.2f}s -> {len(replies) / elapsed:,.1f} replies/s")
+    print(f"ttft p50 {statistics.median(ttfts):.1f} ms, p99 {ttfts[int(len(ttfts) * 0.99) - 1]:.1f} ms")
+    print(f"tokens/sec (median) {statistics.median(r.tokens_per_sec for r in replies):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Per-session query latency on a large messages table, before and after the index migration.
+
+    python bench/bench_schema.py [--messages 2000000] [--sessions 20000] [--queries 200]
+
+Seeds a throwaway database at the schema version just before the indexes, times the
+transcript/status queries the API runs, applies the remaining migrations and times them again.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+QUERIES = {
+    "transcript page": (
+        "SELECT id, sender, content, timestamp, metadata FROM messages "
+        "WHERE session_id = ? AND id > ? ORDER BY id LIMIT 500",
+        lambda sid: (sid, 0),
+    ),
+    "message count": (
+        "SELECT COUNT(*) FROM messages WHERE session_id = ?",
+        lambda sid: (sid,),
+    ),
+    "running sessions": (
+        "SELECT session_id FROM sessions WHERE status = ?",
+        lambda sid: ("running",),
+    ),
+}
+
+
+def seed(conn, messages: int, sessions: int) -> list:
+    session_ids = [f"session-{i:06d}" for i in range(sessions)]
+    statuses = ["finished"] * 97 + ["running", "paused", "failed"]
+    conn.executemany(
+        "INSERT INTO sessions (session_id, target_model, success_criteria, max_attempts, status) "
+        "VALUES (?, 'llama3.2:1b', 'criteria', 50, ?)",
+        ((sid, random.choice(statuses)) for sid in session_ids),
+    )
+    senders = ("attacker", "target", "judge")
+    batch = 50_000
+    for start in range(0, messages, batch):
+        conn.executemany(
+            "INSERT INTO messages (session_id, sender, content) VALUES (?, ?, ?)",
+            ((random.choice(session_ids), senders[i % 3], f"message body {i}")
+             for i in range(start, min(start + batch, messages))),
+        )
+    conn.commit()
+    return session_ids
+
+
+def time_queries(conn, session_ids: list, queries: int) -> dict:
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        samples = []
+        for sid in random.sample(session_ids, queries):
+            start = time.perf_counter()
+            conn.execute(sql, params(sid)).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+        results[name] = statistics.median(samples)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=200, help="samples per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        index_migration = database.MIGRATIONS.index(database._add_lookup_indexes)
+        database.migrate(target=index_migration)
+        conn = database.get_connection()
+
+        start = time.perf_counter()
+        session_ids = seed(conn, args.messages, args.sessions)
+        print(f"seeded {args.messages:,} messages over {args.sessions:,} sessions "
+              f"in {time.perf_counter() - start:.1f}s")
+
+        before = time_queries(conn, session_ids, args.queries)
+
+        start = time.perf_counter()
+        database.migrate()
+        print(f"index migration took {time.perf_counter() - start:.1f}s")
+
+        after = time_queries(conn, session_ids, args.queries)
+        database.close_connections()
+
+    print(f"\n{'query (median)':<20}{'before':>12}{'after':>12}")
+    for name in QUERIES:
+        print(f"{name:<20}{before[name]:>10.2f}ms{after[name]:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
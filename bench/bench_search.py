@@ -0,0 +1,124 @@
+"""
+Full-text search latency on a large messages table, next to the LIKE scan it replaces.
+
+    python bench/bench_search.py [--messages 1000000] [--sessions 20000] [--queries 100]
+
+Seeds a throwaway database with word-salad transcripts (a Zipf-like vocabulary, so there are
+both very common and rare words) from sessions that ran a few dozen at a time, and one attempt
+per attacker/target/judge triple, then times
+search.search() for rare and common words, with and without filters.
+"""
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+VOCABULARY = 20_000
+CONCURRENT = 32
+MODELS = ["llama3.2:1b", "llama3.1:8b", "mistral:7b", "qwen2.5:7b"]
+
+
+def words(count: int) -> list:
+    return [f"w{i}" for i in range(count)]
+
+
+def seed(conn, messages: int, sessions: int) -> list:
+    vocabulary = words(VOCABULARY)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(VOCABULARY)))
+    session_ids = [f"session-{i:06d}" for i in range(sessions)]
+    conn.executemany(
+        "INSERT INTO sessions (session_id, target_model, success_criteria, max_attempts, status) "
+        "VALUES (?, ?, 'criteria', 50, 'finished')",
+        ((sid, random.choice(MODELS)) for sid in session_ids),
+    )
+
+    senders = ("attacker", "target", "judge")
+    batch = 30_000  #a multiple of 3, so triples don't straddle batches
+    for start in range(0, messages - messages % 3, batch):
+        rows = []
+        for i in range(start, min(start + batch, messages - messages % 3), 3):
+            #sessions run CONCURRENT at a time, so each one's messages are close together
+            sid = session_ids[min(sessions - 1, i * sessions // messages + random.randrange(CONCURRENT))]
+            for sender in senders:
+                text = " ".join(random.choices(vocabulary, cum_weights=cum_weights, k=random.randint(20, 80)))
+                rows.append((sid, sender, text))
+        first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM messages").fetchone()[0]
+        conn.executemany("INSERT INTO messages (session_id, sender, content) VALUES (?, ?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO attempts (session_id, attempt_index, prompt_message_id, response_message_id, "
+            "verdict_message_id, success) VALUES (?, ?, ?, ?, ?, ?)",
+            ((rows[j][0], j // 3, first + j, first + j + 1, first + j + 2, int(random.random() < 0.02))
+             for j in range(0, len(rows), 3)),
+        )
+        conn.commit()
+    return session_ids
+
+
+def time_calls(fn, args_list: list) -> tuple:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1] if len(samples) > 1 else samples[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    import database
+    import search
+    from search import SearchFilters
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.create_tables()
+        conn = database.get_connection()
+        start = time.perf_counter()
+        session_ids = seed(conn, args.messages, args.sessions)
+        print(f"seeded {args.messages:,} messages (indexed by the triggers) in {time.perf_counter() - start:.0f}s")
+
+        vocabulary = words(VOCABULARY)
+        common, rare = vocabulary[:20], vocabulary[-2000:]
+        #each case draws fresh arguments per call, so it isn't the same query answered from cache
+        cases = {
+            "rare word": lambda: (random.choice(rare), SearchFilters()),
+            "common word": lambda: (random.choice(common), SearchFilters()),
+            "common word, newest": lambda: (random.choice(common), SearchFilters(), "newest"),
+            "two words": lambda: (f"{random.choice(common)} {random.choice(rare)}", SearchFilters()),
+            "prefix": lambda: (f"w{random.randint(100, 999)}*", SearchFilters()),
+            "rare + model + sender": lambda: (random.choice(rare),
+                                              SearchFilters(model=random.choice(MODELS), sender="attacker")),
+            "rare + success": lambda: (random.choice(rare), SearchFilters(success=True)),
+            "common + session": lambda: (random.choice(common),
+                                         SearchFilters(session_ids=[random.choice(session_ids)])),
+        }
+
+        print(f"{'query':<24}{'p50 ms':>10}{'p99 ms':>10}")
+        for name, make in cases.items():
+            p50, p99 = time_calls(search.search, [make() for _ in range(args.queries)])
+            print(f"{name:<24}{p50:>10.2f}{p99:>10.2f}")
+
+        #for comparison, what finding a word took before the index: the first page, and every match
+        #(which sessions ever produced it)
+        for name, sql in (("LIKE, first page", "SELECT id FROM messages WHERE content LIKE ? ORDER BY id DESC LIMIT 21"),
+                          ("LIKE, all matches", "SELECT DISTINCT session_id FROM messages WHERE content LIKE ?")):
+            p50, _ = time_calls(lambda pattern: conn.execute(sql, (pattern,)).fetchall(),
+                                [(f"% {random.choice(rare)} %",) for _ in range(3)])
+            print(f"{name:<24}{p50:>10.2f}{'-':>10}")
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
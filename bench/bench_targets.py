@@ -0,0 +1,70 @@
+"""
+Model reloads and wall time when sessions against different local models run at once,
+with and without the target scheduler's resident-model limit.
+
+    python bench/bench_targets.py [--models 3] [--sessions 2] [--turns 6] [--load-time 1.0]
+
+The Ollama stub holds one model in memory and takes --load-time to load another, like a GPU
+box that fits one large model. Each session sends --turns prompts to its model, pausing
+--think between them the way an attack waits on Gemini.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import ollama_stub
+
+
+async def drive(models: list, sessions: int, turns: int, think: float, resident: int) -> tuple:
+    import ollama
+    ollama.scheduler = ollama.TargetScheduler(resident=resident, idle_grace=1.0, max_cold_wait=10.0)
+
+    async def session(model: str):
+        for turn in range(turns):
+            await ollama.chat(model, f"turn {turn}")
+            await asyncio.sleep(think)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(model) for model in models for _ in range(sessions)))
+    elapsed = time.perf_counter() - start
+    await ollama.close_client()
+    return elapsed, ollama.scheduler.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per model")
+    parser.add_argument("--turns", type=int, default=6, help="prompts per session")
+    parser.add_argument("--think", type=float, default=0.2, help="seconds between a session's prompts")
+    parser.add_argument("--load-time", type=float, default=1.0)
+    args = parser.parse_args()
+
+    models = [f"model-{i}:7b" for i in range(args.models)]
+    config = ollama_stub.StubConfig(models=models, ttft=0.02, tokens=10, token_delay=0.002,
+                                    load_time=args.load_time, max_loaded=1)
+    server = ollama_stub.start(config)
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{server.server_port}"
+    import ollama
+    ollama.OLLAMA_URL = os.environ["OLLAMA_URL"]
+
+    results = {}
+    for label, resident in (("unordered", 0), ("scheduled", 1)):
+        config.loaded.clear()
+        config.loads = 0
+        elapsed, stats = asyncio.run(drive(models, args.sessions, args.turns, args.think, resident))
+        results[label] = elapsed
+        print(f"{label:<10} {stats.requests} requests in {elapsed:.1f}s, {config.loads} model loads "
+              f"({stats.load_seconds:.1f}s loading), {stats.warm_hits} warm hits, {stats.reloads} reloads")
+    server.shutdown()
+
+    print(f"speedup: {results['unordered'] / results['scheduled']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Offline stand-in for the google-genai client, so the attack loop can run without an API key.
+
+    import gemini
+    from fake_gemini import FakeGeminiClient, FakeConfig
+    gemini.client = FakeGeminiClient(FakeConfig(rtt=0.3))
+
+Latency is a fixed round-trip plus a per-token cost for input and output, roughly how the
+real API behaves, optionally spread by a seeded lognormal jitter. Judge prompts get a verdict back, everything else gets jailbreak prompts
+(a JSON list of them when the prompt asks for several). Context caches (client.aio.caches)
+are kept in memory; tokens read from one cost cached_token_cost instead of input_token_cost.
+"""
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Optional
+
+from google.genai import errors
+
+
+@dataclass
+class FakeConfig:
+    rtt: float = 0.2                   #seconds per call before any tokens
+    input_token_cost: float = 0.00002  #seconds per prompt token
+    cached_token_cost: float = 0.0     #seconds per prompt token read from a context cache
+    output_token_cost: float = 0.004   #seconds per generated token
+    prompt_tokens: int = 200           #tokens in one generated jailbreak prompt
+    failure_rate: float = 0.0          #share of calls that fail with a 503
+    jitter: float = 0.0                #sigma of a lognormal factor on each call's latency
+    success_rate: float = 0.1          #share of judge calls that say the jailbreak worked
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeStats:
+    calls: int = 0
+    failures: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    judge_calls: int = 0
+    caches_created: int = 0
+    caches_deleted: int = 0
+    caches_updated: int = 0
+    seconds: float = 0.0  #simulated time spent in generate_content
+    prompts: list = field(default_factory=list)
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _not_found(name: str) -> errors.APIError:
+    return errors.APIError(404, {"error": {"message": f"{name} not found", "status": "NOT_FOUND"}})
+
+
+class _Caches:
+
+    def __init__(self, config: FakeConfig, stats: FakeStats):
+        self.config = config
+        self.stats = stats
+        self.entries: dict = {}  #name -> cached tokens
+
+    async def create(self, model: str, config=None):
+        tokens = _tokens(getattr(config, "system_instruction", None) or "")
+        tokens += sum(_tokens(str(c)) for c in getattr(config, "contents", None) or [])
+        await asyncio.sleep(self.config.rtt + tokens * self.config.input_token_cost)
+        self.stats.caches_created += 1
+        name = f"cachedContents/fake-{self.stats.caches_created}"
+        self.entries[name] = tokens
+        return SimpleNamespace(name=name, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+    async def delete(self, name: str, config=None):
+        if self.entries.pop(name, None) is None:
+            raise _not_found(name)
+        self.stats.caches_deleted += 1
+
+    async def update(self, name: str, config=None):
+        await asyncio.sleep(self.config.rtt)
+        if name not in self.entries:
+            raise _not_found(name)
+        self.stats.caches_updated += 1
+        return SimpleNamespace(name=name)
+
+
+class _Models:
+
+    def __init__(self, config: FakeConfig, stats: FakeStats, caches: _Caches):
+        self.config = config
+        self.stats = stats
+        self.caches = caches
+        self.random = random.Random(config.seed)
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        self.stats.calls += 1
+        self.stats.prompts.append(contents)
+        cache_name = getattr(config, "cached_content", None)
+        if cache_name and cache_name not in self.caches.entries:
+            raise _not_found(cache_name)
+        cached_tokens = self.caches.entries[cache_name] if cache_name else 0
+        system = getattr(config, "system_instruction", None) or ""
+        input_tokens = _tokens(contents) + (_tokens(system) if system else 0)
+
+        if self.random.random() < self.config.failure_rate:
+            self.stats.failures += 1
+            await asyncio.sleep(self.config.rtt)
+            raise errors.APIError(503, {"error": {"message": "fake overload", "status": "UNAVAILABLE"}})
+
+        if "acting as a judge" in contents:
+            self.stats.judge_calls += 1
+            success = self.random.random() < self.config.success_rate
+            text = "9" if success else "2"  #the judge prompt asks for a bare 1-10 score
+            parsed = None
+        else:
+            match = re.search(r"exactly (\d+)", contents)
+            count = int(match.group(1)) if match else 1
+            body = " ".join(["word"] * (self.config.prompt_tokens - 10))
+            prompts = [f"Candidate {i} ({self.random.randrange(10**6)}): {body}" for i in range(count)]
+            if match:
+                text = json.dumps(prompts)
+                parsed = prompts
+            else:
+                text, parsed = prompts[0], None
+
+        output_tokens = _tokens(text)
+        self.stats.input_tokens += input_tokens
+        self.stats.cached_tokens += cached_tokens
+        self.stats.output_tokens += output_tokens
+        latency = (self.config.rtt
+                   + input_tokens * self.config.input_token_cost
+                   + cached_tokens * self.config.cached_token_cost
+                   + output_tokens * self.config.output_token_cost)
+        if self.config.jitter:
+            latency *= self.random.lognormvariate(0, self.config.jitter)
+        self.stats.seconds += latency
+        await asyncio.sleep(latency)
+
+        return SimpleNamespace(
+            text=text,
+            parsed=parsed,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=input_tokens + cached_tokens,  #like the API, includes the cached part
+                cached_content_token_count=cached_tokens or None,
+                candidates_token_count=output_tokens,
+                total_token_count=input_tokens + cached_tokens + output_tokens,
+            ),
+        )
+
+
+class FakeGeminiClient:
+    """Has the pieces of genai.Client the backend uses: client.aio.models and client.aio.caches."""
+
+    def __init__(self, config: Optional[FakeConfig] = None):
+        self.config = config or FakeConfig()
+        self.stats = FakeStats()
+        caches = _Caches(self.config, self.stats)
+        self.aio = SimpleNamespace(models=_Models(self.config, self.stats, caches), caches=caches)
@@ -0,0 +1,226 @@
+"""
+Minimal stand-in for the Ollama HTTP API, for running the backend without a GPU box.
+
+    python bench/ollama_stub.py [--port 11434] [--ttft 0.05] [--tokens 20] [--token-delay 0.005]
+                                [--load-time 0] [--max-loaded 1] [--failure-rate 0] [--jitter 0] [--seed N]
+
+Implements GET /api/tags and streaming POST /api/chat (NDJSON, chunked) the way Ollama does,
+including the prompt_eval_count/eval_count/eval_duration/load_duration fields in the final chunk.
+
+With --load-time, models behave like Ollama's: at most --max-loaded stay in memory, a request
+for one that isn't loaded first waits load_time (evicting the least recently used), and a
+chat request with no messages and keep_alive 0 unloads the model. --failure-rate answers that
+share of chat requests with a 503, and --jitter spreads latency (seeded by --seed).
+
+For tests, StubConfig.script lists faults for the next chat requests, one per request:
+"503" / "429" (error status), "disconnect" (close without answering), "stall" (send the headers,
+then nothing for stall_seconds) and "error" (a token, then an {"error": ...} chunk).
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = ["llama3.2:1b", "qwen2.5:0.5b", "gemma2:2b"]
+
+
+class StubConfig:
+    def __init__(self, models=None, ttft: float = 0.05, tokens: int = 20, token_delay: float = 0.005,
+                 reply: str = "I'm sorry, but I can't help with that.", load_time: float = 0.0,
+                 max_loaded: int = 1, failure_rate: float = 0.0, jitter: float = 0.0,
+                 unique_replies: bool = False, seed: int = None, script=None, stall_seconds: float = 5.0):
+        self.models = models or list(DEFAULT_MODELS)
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.reply = reply
+        self.load_time = load_time    #seconds to load a model that isn't in memory, 0 = always warm
+        self.max_loaded = max_loaded
+        self.requests = 0
+        self.loads = 0
+        self.loaded: OrderedDict = OrderedDict()  #model -> None, least recently used first
+        self.failure_rate = failure_rate      #share of chat requests answered with a 503
+        self.jitter = jitter                  #sigma of a lognormal factor on ttft and token delay
+        self.unique_replies = unique_replies  #end every reply with the request number, so no two are alike
+        self.failures = 0
+        self.script = list(script or [])  #faults for the next chat requests, in order
+        self.stall_seconds = stall_seconds
+        self._lock = threading.Lock()  #one load at a time, like Ollama's scheduler
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def draw(self) -> tuple[int, bool, float]:
+        """Request number, whether this request fails, and its latency factor - seeded, so runs repeat."""
+        with self._random_lock:
+            self.requests += 1
+            failed = self._random.random() < self.failure_rate
+            factor = self._random.lognormvariate(0, self.jitter) if self.jitter else 1.0
+            return self.requests, failed, factor
+
+    def load(self, model: str) -> float:
+        """Makes sure the model is loaded; returns the seconds spent loading it."""
+        if not self.load_time:
+            return 0.0
+        with self._lock:
+            if model in self.loaded:
+                self.loaded.move_to_end(model)
+                return 0.0
+            while len(self.loaded) >= self.max_loaded:
+                self.loaded.popitem(last=False)
+            time.sleep(self.load_time)
+            self.loaded[model] = None
+            self.loads += 1
+            return self.load_time
+
+    def unload(self, model: str) -> None:
+        with self._lock:
+            self.loaded.pop(model, None)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  #the default of 5 drops SYNs under concurrent load and adds 1s retransmits
+
+
+def make_handler(config: StubConfig):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  #keep-alive, so pooled clients reuse connections
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def handle_one_request(self):
+            try:
+                super().handle_one_request()
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True  #the client gave up on the reply (e.g. a cancelled attempt)
+
+        def _chunk(self, body: dict) -> None:
+            data = (json.dumps(body) + "\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json(200, {"models": [{"name": m} for m in config.models]})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+
+            if self.path != "/api/chat":
+                self._send_json(404, {"error": "not found"})
+                return
+            model = body.get("model")
+            if model not in config.models:
+                self._send_json(404, {"error": f"model '{model}' not found"})
+                return
+
+            if not body.get("messages") and body.get("keep_alive") in (0, "0", "0s"):
+                config.unload(model)
+                self._send_json(200, {"model": model, "done": True, "done_reason": "unload"})
+                return
+
+            number, failed, factor = config.draw()
+            fault = config.script.pop(0) if config.script else None
+            if fault in ("503", "429"):
+                self._send_json(int(fault), {"error": "scripted failure"})
+                return
+            if fault == "disconnect":
+                self.close_connection = True
+                return
+            if failed:
+                config.failures += 1
+                self._send_json(503, {"error": "server busy, please try again"})
+                return
+
+            started = time.perf_counter()
+            load_seconds = config.load(model)
+            words = config.reply.split(" ")
+            if config.unique_replies:
+                words[-1] = f"{words[-1]} #{number}"
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            if fault == "stall":
+                time.sleep(config.stall_seconds)
+                self.close_connection = True
+                return
+            time.sleep(config.ttft * factor)
+            if fault == "error":
+                self._chunk({"model": model, "message": {"role": "assistant", "content": words[0]}, "done": False})
+                self._chunk({"error": "scripted error mid-stream"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+                return
+            eval_started = time.perf_counter()
+            for i in range(config.tokens):
+                token = words[i % len(words)] + " "
+                self._chunk({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+                time.sleep(config.token_delay * factor)
+            ended = time.perf_counter()
+            self._chunk({
+                "model": model,
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "total_duration": int((ended - started) * 1e9),
+                "prompt_eval_count": sum(len(m.get("content", "")) // 4 for m in body.get("messages", [])),
+                "load_duration": int(load_seconds * 1e9),
+                "eval_count": config.tokens,
+                "eval_duration": int((ended - eval_started) * 1e9),
+            })
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def start(config: StubConfig = None, port: int = 0) -> ThreadingHTTPServer:
+    """Starts the stub on a background thread. port=0 picks a free port (server.server_port)."""
+    server = StubServer(("127.0.0.1", port), make_handler(config or StubConfig()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.05, help="seconds before the first token")
+    parser.add_argument("--tokens", type=int, default=20, help="tokens per reply")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between tokens")
+    parser.add_argument("--load-time", type=float, default=0.0, help="seconds to load a cold model")
+    parser.add_argument("--max-loaded", type=int, default=1, help="models kept in memory at once")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0, help="lognormal sigma on latency")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(ttft=args.ttft, tokens=args.tokens, token_delay=args.token_delay,
+                        load_time=args.load_time, max_loaded=args.max_loaded,
+                        failure_rate=args.failure_rate, jitter=args.jitter, seed=args.seed)
+    server = StubServer(("127.0.0.1", args.port), make_handler(config))
+    print(f"Ollama stub listening on http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,24 @@
+import json
 import requests
 
 class ApiClient:
     def __init__(self, base_url="http://127.0.0.1:8000"):
         self.base_url = base_url.rstrip("/")
+        self.cursors = {}  # session_id -> id of the last message already downloaded
 
     def get_models(self):
         res = requests.get(f"{self.base_url}/api/models")
         res.raise_for_status()
         return res.json()["models"]
 
-    def initialize(self, target_model, success_criteria, max_attempts):
+    def initialize(self, target_model, success_criteria, max_attempts, mode="single"):
         res = requests.post(
             f"{self.base_url}/api/initialize",
             json={
                 "target_model": target_model,
                 "success_criteria": success_criteria,
                 "max_attempts": max_attempts,
+                "mode": mode,
             },
         )
         res.raise_for_status()
@@ -25,12 +28,31 @@ class ApiClient:
         res = requests.post(f"{self.base_url}/api/{session_id}/start")
         res.raise_for_status()
 
-    def get_transcript(self, session_id):
-        res = requests.get(f"{self.base_url}/api/{session_id}/messages")
-        if res.status_code == 404:
-            return []
-        res.raise_for_status()
-        return res.json()["transcript"]
+    def get_transcript(self, session_id, since_id=None, page_size=500):
+        """
+        Returns only the messages this client hasn't downloaded yet for the session,
+        following pages until caught up. Pass since_id=0 to read the transcript from the start.
+        """
+        if since_id is None:
+            since_id = self.cursors.get(session_id, 0)
+
+        messages = []
+        while True:
+            res = requests.get(
+                f"{self.base_url}/api/{session_id}/messages",
+                params={"since_id": since_id, "limit": page_size},
+            )
+            if res.status_code == 404:
+                return messages
+            res.raise_for_status()
+            page = res.json()
+            messages.extend(page["transcript"])
+            since_id = page["next_since_id"]
+            if not page["has_more"]:
+                break
+
+        self.cursors[session_id] = since_id
+        return messages
 
     def get_status(self, session_id: str):
         url = f"{self.base_url}/api/{session_id}/status"
@@ -40,8 +62,61 @@ class ApiClient:
 
     def session_action(self, session_id, action):
         res = requests.post(
-            f"{self.base_url}/api/{session_id}/action",
+            f"{self.base_url}/api/{session_id}/control",
             json={"action": action}
         )
         res.raise_for_status()
-        return res.json()
\ No newline at end of file
+        return res.json()
+
+    def create_campaign(self, success_criteria, max_attempts, models=None, mode="single"):
+        """Starts one session per (model, criteria) pair; models=None means every local model."""
+        res = requests.post(
+            f"{self.base_url}/api/campaigns",
+            json={
+                "models": models or [],
+                "success_criteria": success_criteria,
+                "max_attempts": max_attempts,
+                "mode": mode,
+            },
+        )
+        res.raise_for_status()
+        return res.json()
+
+    def get_campaign(self, campaign_id):
+        res = requests.get(f"{self.base_url}/api/campaigns/{campaign_id}")
+        res.raise_for_status()
+        return res.json()
+
+    def stop_campaign(self, campaign_id):
+        res = requests.post(f"{self.base_url}/api/campaigns/{campaign_id}/stop")
+        res.raise_for_status()
+        return res.json()
+
+    def stream_events(self, session_id, since_id=0, heartbeat=None):
+        """
+        Yields events from the backend's Server-Sent Events stream:
+        {"type": "status", "status": ...}, {"type": "message", "id": ..., "sender": ..., ...}, and
+        {"type": "heartbeat"} for every keep-alive, which the server sends after `heartbeat` quiet seconds.
+        Resumes after since_id (sent as Last-Event-ID). Returns when the stream ends: on a final
+        status, or when the server drops it - the caller reconnects from the last message id.
+        """
+        params = {"heartbeat": heartbeat} if heartbeat else {}
+        with requests.get(
+            f"{self.base_url}/api/{session_id}/events",
+            params=params,
+            headers={"Last-Event-ID": str(since_id)},
+            stream=True,
+            timeout=(5, heartbeat * 3 if heartbeat else None),  # a silent connection is a dead one
+        ) as res:
+            res.raise_for_status()
+            data = []
+            for line in res.iter_lines(decode_unicode=True):
+                if line is None:
+                    continue
+                if line.startswith(":"):
+                    yield {"type": "heartbeat"}
+                elif line.startswith("data:"):
+                    data.append(line[5:].strip())
+                elif line == "" and data:
+                    yield json.loads("\n".join(data))
+                    data = []
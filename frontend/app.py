@@ -1,5 +1,6 @@
 import streamlit as st
 from api_client import ApiClient
+import requests
 import time
 
 
@@ -21,6 +22,80 @@ if "start_time" not in st.session_state:
 if "end_time" not in st.session_state:
     st.session_state.end_time = None
 
+# transcript and status are kept here and only ever appended to from the event stream,
+# so a rerun redraws from memory instead of re-fetching the whole transcript
+if "transcript" not in st.session_state:
+    st.session_state.transcript = []
+
+if "last_message_id" not in st.session_state:
+    st.session_state.last_message_id = 0
+
+if "status" not in st.session_state:
+    st.session_state.status = None
+
+FINAL_STATUSES = ["finished", "failed", "success_found"]
+LIVE_HEARTBEAT = 2  # seconds between keep-alives on the event stream: how soon a button click is handled
+RECONNECT_SECONDS = 1
+
+
+def render_elapsed(box):
+
+    if st.session_state.end_time is not None:
+        elapsed = int(st.session_state.end_time - st.session_state.start_time)
+    else:
+        elapsed = int(time.time() - st.session_state.start_time)
+
+    box.markdown(
+        f"""
+        <span class="stat-label">Elapsed</span>
+        <span class="stat-value">{elapsed}s</span>
+        """,
+        unsafe_allow_html=True
+    )
+
+
+def render_message(msg):
+
+    sender = msg["sender"]
+    content = msg["content"]
+    timestamp = msg.get("timestamp", "")
+
+    if sender == "attacker":
+        avatar_class = "avatar avatar-ax"
+        name = "AgentXploit"
+        avatar_text = "AX"
+
+    elif sender == "target":
+        avatar_class = "avatar avatar-ai"
+        name = "Target Model"
+        avatar_text = "AI"
+
+    else:
+        avatar_class = "avatar avatar-ai"
+        name = "Judge"
+        avatar_text = "J"
+
+    st.markdown(f"""
+        <div class="msg-card">
+
+        <div class="msg-header">
+        <div class="{avatar_class}">
+        {avatar_text}
+        </div>
+
+        <div class="msg-meta">
+        <span class="msg-name">{name}</span>
+        <span class="msg-time">{timestamp}</span>
+        </div>
+        </div>
+
+        <div class="msg-body">
+        {content}
+        </div>
+
+        </div>
+        """, unsafe_allow_html=True)
+
 
 # load correct css
 if st.session_state.session_id is None:
@@ -61,6 +136,13 @@ if st.session_state.session_id is None:
         value=50
     )
 
+    mode = st.radio(
+        "Mode",
+        ["single", "multi_turn"],
+        format_func=lambda m: "Independent attempts" if m == "single" else "Multi-turn conversation",
+        horizontal=True
+    )
+
     if st.button("Start Test"):
 
         if not success_criteria.strip():
@@ -72,6 +154,7 @@ if st.session_state.session_id is None:
                 selected_model,
                 success_criteria,
                 max_attempts,
+                mode,
             )
 
             client.start_attack(session_id)
@@ -79,6 +162,9 @@ if st.session_state.session_id is None:
             st.session_state.session_id = session_id
             st.session_state.start_time = time.time()
             st.session_state.end_time = None
+            st.session_state.transcript = []
+            st.session_state.last_message_id = 0
+            st.session_state.status = None
 
             st.rerun()
 
@@ -96,20 +182,16 @@ else:
 
     session_id = st.session_state.session_id
 
-    status_response = client.get_status(session_id)
-    status = status_response["status"]
+    # only the first render asks for the status, after that the event stream keeps it current
+    if st.session_state.status is None:
+        st.session_state.status = client.get_status(session_id)["status"]
+    status = st.session_state.status
 
     # save finish time
-    if status in ["finished", "failed", "success_found"]:
+    if status in FINAL_STATUSES:
         if st.session_state.end_time is None:
             st.session_state.end_time = time.time()
 
-    # timer calculation
-    if st.session_state.end_time is not None:
-        elapsed = int(st.session_state.end_time - st.session_state.start_time)
-    else:
-        elapsed = int(time.time() - st.session_state.start_time)
-
     col1, col2, col3, col4 = st.columns([2,2,2,2])
 
     with col1:
@@ -149,13 +231,8 @@ else:
         )
 
     with col4:
-        st.markdown(
-            f"""
-            <span class="stat-label">Elapsed</span>
-            <span class="stat-value">{elapsed}s</span>
-            """,
-            unsafe_allow_html=True
-        )
+        elapsed_box = st.empty()
+        render_elapsed(elapsed_box)
 
     st.divider()
 
@@ -163,7 +240,7 @@ else:
     # CONTROL BUTTONS
     # ==========================
 
-    if status not in ["finished", "failed", "success_found"]:
+    if status not in FINAL_STATUSES:
 
         left, right = st.columns([8,2])
 
@@ -173,17 +250,17 @@ else:
 
             with c1:
                 if st.button("Pause"):
-                    client.session_action(session_id, "pause")
+                    st.session_state.status = client.session_action(session_id, "pause")["status"]
                     st.rerun()
 
             with c2:
                 if st.button("Resume"):
-                    client.session_action(session_id, "resume")
+                    st.session_state.status = client.session_action(session_id, "resume")["status"]
                     st.rerun()
 
             with c3:
                 if st.button("Stop"):
-                    client.session_action(session_id, "stop")
+                    st.session_state.status = client.session_action(session_id, "stop")["status"]
                     st.rerun()
 
     st.divider()
@@ -192,67 +269,21 @@ else:
     # CHAT TRANSCRIPT
     # ==========================
 
-    transcript_response = client.get_transcript(session_id)
-
-    if isinstance(transcript_response, dict) and "transcript" in transcript_response:
-        transcript = transcript_response["transcript"]
-    else:
-        transcript = transcript_response
-
     st.markdown('<div class="chat-area">', unsafe_allow_html=True)
 
-    if not transcript:
+    for msg in st.session_state.transcript:
+        render_message(msg)
 
-        st.markdown(
+    # new messages from the event stream are appended here
+    live = st.container()
+
+    empty_notice = st.empty()
+    if not st.session_state.transcript:
+        empty_notice.markdown(
             '<div class="empty-chat">Waiting for messages...</div>',
             unsafe_allow_html=True
         )
 
-    else:
-
-        for msg in transcript:
-
-            sender = msg["sender"]
-            content = msg["content"]
-            timestamp = msg.get("timestamp", "")
-
-            if sender == "attacker":
-                avatar_class = "avatar avatar-ax"
-                name = "AgentXploit"
-                avatar_text = "AX"
-
-            elif sender == "target":
-                avatar_class = "avatar avatar-ai"
-                name = "Target Model"
-                avatar_text = "AI"
-
-            else:
-                avatar_class = "avatar avatar-ai"
-                name = "Judge"
-                avatar_text = "J"
-
-            st.markdown(f"""
-        <div class="msg-card">
-
-        <div class="msg-header">
-        <div class="{avatar_class}">
-        {avatar_text}
-        </div>
-
-        <div class="msg-meta">
-        <span class="msg-name">{name}</span>
-        <span class="msg-time">{timestamp}</span>
-        </div>
-        </div>
-
-        <div class="msg-body">
-        {content}
-        </div>
-
-        </div>
-        """, unsafe_allow_html=True)
-
-
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.divider()
@@ -261,7 +292,7 @@ else:
     # FINISH BUTTON
     # ==========================
 
-    if status in ["finished", "failed", "success_found"]:
+    if status in FINAL_STATUSES:
 
         left, center, right = st.columns([3,2,3])
 
@@ -275,12 +306,47 @@ else:
                 st.session_state.session_id = None
                 st.session_state.start_time = None
                 st.session_state.end_time = None
+                st.session_state.transcript = []
+                st.session_state.last_message_id = 0
+                st.session_state.status = None
                 st.rerun()
 
     # ==========================
-    # AUTO REFRESH
+    # LIVE UPDATES
     # ==========================
 
-    if status not in ["finished", "failed", "success_found"]:
-        time.sleep(1)
-        st.rerun()
\ No newline at end of file
+    # blocks on the server's event stream: new messages are drawn as they arrive,
+    # and a status change triggers one rerun to redraw the header and buttons.
+    # every keep-alive redraws the timer - a st call is where a button click's rerun
+    # can interrupt this loop - and a stream that ends without a final status
+    # (dropped by the server, connection lost) is reopened from the last message
+    if status not in FINAL_STATUSES:
+
+        while True:
+
+            try:
+                for event in client.stream_events(
+                    session_id,
+                    st.session_state.last_message_id,
+                    heartbeat=LIVE_HEARTBEAT
+                ):
+
+                    if event["type"] == "heartbeat":
+                        render_elapsed(elapsed_box)
+
+                    elif event["type"] == "message":
+                        st.session_state.transcript.append(event)
+                        st.session_state.last_message_id = event["id"]
+                        empty_notice.empty()
+                        with live:
+                            render_message(event)
+
+                    elif event["status"] != st.session_state.status:
+                        st.session_state.status = event["status"]
+                        st.rerun()
+
+            except requests.RequestException:
+                pass
+
+            render_elapsed(elapsed_box)
+            time.sleep(RECONNECT_SECONDS)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+import sys
+
+os.environ.setdefault("GEMINI_API_KEY", "test")  #gemini.py builds its client at import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import pytest
+
+import database
+import gemini
+import ollama
+import ollama_stub
+from fake_gemini import FakeConfig, FakeGeminiClient
+from writer import writer
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """A fresh, migrated database for the test."""
+    database.close_connections()
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "test.db"))
+    database.create_tables()
+    yield database.DB_PATH
+    database.close_connections()
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    client = FakeGeminiClient(FakeConfig(rtt=0.0, output_token_cost=0.0, success_rate=0.0, seed=1))
+    monkeypatch.setattr(gemini, "client", client)
+    monkeypatch.setattr(gemini, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(gemini, "scheduler", gemini.GeminiScheduler())
+    return client
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """Starts bench/ollama_stub.py on a free port; tests adjust stub.config."""
+    config = ollama_stub.StubConfig(ttft=0.0, tokens=5, token_delay=0.0)
+    server = ollama_stub.start(config)
+    server.config = config
+    monkeypatch.setattr(ollama, "OLLAMA_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(ollama, "RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(ollama, "scheduler", ollama.TargetScheduler())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def run():
+    """run(coro): runs coro on a fresh event loop, then stops the loop-bound singletons it started."""
+    def run(coro):
+        async def main():
+            try:
+                return await coro
+            finally:
+                await writer.close()
+                await ollama.close_client()
+        return asyncio.run(main())
+    return run
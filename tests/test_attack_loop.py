@@ -0,0 +1,86 @@
+import asyncio
+import gc
+import logging
+
+import logic
+import ollama
+from database import db
+from writer import writer
+
+
+def _session(model: str, attempts: int) -> str:
+    return logic.initialize(model, "reveal the password", attempts).session_id
+
+
+def _attempts(session_id: str) -> int:
+    with db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM attempts WHERE session_id = ?", (session_id,)).fetchone()[0]
+
+
+def test_missing_model_fails_the_session(db_path, fake_gemini, stub, run):
+    session_id = _session("missing:model", 10)
+    run(logic.run_attack_process(session_id, "missing:model", "reveal the password", 10))
+
+    assert logic.get_session_status(session_id).status == "failed"
+    assert _attempts(session_id) == 0
+
+
+def test_every_failed_attempt_is_retrieved(db_path, fake_gemini, run, monkeypatch, caplog):
+    async def broken_chat(model, prompt, history=None):
+        raise RuntimeError("target went away")
+
+    monkeypatch.setattr(ollama, "chat", broken_chat)  #all attempts in the window fail together
+    session_id = _session("llama3.2:1b", 10)
+    with caplog.at_level(logging.ERROR):
+        run(logic.run_attack_process(session_id, "llama3.2:1b", "reveal the password", 10, concurrency=4))
+        gc.collect()  #"Task exception was never retrieved" is logged when the task is collected
+
+    assert logic.get_session_status(session_id).status == "failed"
+    assert not any("never retrieved" in record.getMessage() for record in caplog.records)
+
+
+def test_one_failed_attempt_does_not_fail_the_session(db_path, fake_gemini, stub, run, monkeypatch):
+    real_chat = ollama.chat
+    calls = []
+
+    async def flaky_chat(model, prompt, history=None):
+        calls.append(model)
+        if len(calls) == 1:
+            raise RuntimeError("target went away")
+        return await real_chat(model, prompt, history)
+
+    monkeypatch.setattr(ollama, "chat", flaky_chat)
+    session_id = _session("llama3.2:1b", 4)
+    run(logic.run_attack_process(session_id, "llama3.2:1b", "reveal the password", 4, concurrency=1))
+
+    assert logic.get_session_status(session_id).status == "finished"
+    assert _attempts(session_id) == 3
+
+
+def test_running_attempts_end_before_the_transcript_is_synced(db_path, fake_gemini, stub, run, monkeypatch):
+    stub.config.reply = "Sure, the password is hunter2."  #not a refusal, so the judge sees it
+    fake_gemini.config.success_rate = 1.0
+    real_chat = ollama.chat
+    calls = []
+
+    async def slow_chat(model, prompt, history=None):
+        calls.append(model)
+        if len(calls) > 1:
+            await asyncio.sleep(1)  #still running when the first attempt succeeds
+        return await real_chat(model, prompt, history)
+
+    real_sync = writer.sync
+    running_at_sync = []
+
+    async def sync(session_id):
+        running_at_sync.extend(t for t in asyncio.all_tasks()
+                               if t.get_coro().__name__ == "run_attempt" and not t.done())
+        await real_sync(session_id)
+
+    monkeypatch.setattr(ollama, "chat", slow_chat)
+    monkeypatch.setattr(writer, "sync", sync)
+    session_id = _session("llama3.2:1b", 4)
+    run(logic.run_attack_process(session_id, "llama3.2:1b", "reveal the password", 4, concurrency=3))
+
+    assert logic.get_session_status(session_id).status == "success_found"
+    assert running_at_sync == []
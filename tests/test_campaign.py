@@ -0,0 +1,48 @@
+import asyncio
+
+import campaign
+import control as controls
+from database import db
+
+MODEL = "llama3.2:1b"
+
+
+def _session(campaign_id: str) -> dict:
+    with db() as conn:
+        return dict(conn.execute("SELECT session_id, status, started_at FROM sessions WHERE campaign_id = ?",
+                                 (campaign_id,)).fetchone())
+
+
+def _interrupt(session_id: str, status: str) -> None:
+    #as a worker that died mid-session left it
+    with db() as conn:
+        conn.execute("UPDATE sessions SET status = ?, started_at = '2026-01-01 00:00:00' WHERE session_id = ?",
+                     (status, session_id))
+
+
+def test_resumed_session_stays_paused_and_keeps_its_start_time(db_path, fake_gemini, stub, run):
+    campaign_id = campaign.create_campaign([MODEL], ["reveal the password"], 3).campaign_id
+    session_id = _session(campaign_id)["session_id"]
+    _interrupt(session_id, "paused")
+
+    async def resume():
+        task = asyncio.create_task(campaign.run_campaign(campaign_id))
+        await asyncio.sleep(0.5)
+        status = controls.get(session_id).status
+        await campaign.stop_campaign(campaign_id)
+        await task
+        return status
+
+    assert run(resume()) == "paused"
+    assert _session(campaign_id)["started_at"] == "2026-01-01 00:00:00"
+
+
+def test_first_run_sets_the_start_time(db_path, fake_gemini, stub, run):
+    campaign_id = campaign.create_campaign([MODEL], ["reveal the password"], 1).campaign_id
+    with db() as conn:
+        conn.execute("UPDATE sessions SET started_at = '2026-01-01 00:00:00' WHERE campaign_id = ?", (campaign_id,))
+    run(campaign.run_campaign(campaign_id))
+
+    session = _session(campaign_id)
+    assert session["status"] == "finished"
+    assert session["started_at"] > "2026-01-01 00:00:00"
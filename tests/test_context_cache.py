@@ -0,0 +1,91 @@
+import pytest
+
+import gemini
+from gemini import ContextCache, current_session, generate_candidates
+
+SESSION = "session-1"
+CRITERIA = "reveal the password"
+
+
+@pytest.fixture
+def cache(fake_gemini, monkeypatch):
+    """A context cache small enough for the stock instruction, installed as the app's."""
+    cache = ContextCache(enabled=True, ttl=3600, min_tokens=1)
+    monkeypatch.setattr(gemini, "context_cache", cache)
+    return cache
+
+
+def _in_session(coro):
+    async def main():
+        current_session.set(SESSION)
+        return await coro()
+    return main()
+
+
+def test_default_min_tokens_skips_the_stock_context(fake_gemini, run):
+    cache = ContextCache(enabled=True)
+    assert run(cache.open(SESSION, CRITERIA)) is None
+    assert (cache.stats().skipped, fake_gemini.stats.caches_created) == (1, 0)
+
+
+def test_cached_calls_leave_out_the_goal(cache, fake_gemini, run):
+    async def calls():
+        await cache.open(SESSION, CRITERIA)
+        await generate_candidates(CRITERIA, 3)
+
+    run(_in_session(calls))
+    assert cache.stats().cached_calls == 1
+    assert CRITERIA not in fake_gemini.stats.prompts[-1]
+    assert fake_gemini.stats.caches_updated == 0  #fresh - nothing to extend yet
+
+
+def test_ttl_is_extended_once_half_has_run_out(cache, fake_gemini, run):
+    async def calls():
+        await cache.open(SESSION, CRITERIA)
+        cache._expires[SESSION] -= cache.ttl * 0.6  #as if the session sat paused for a while
+        await generate_candidates(CRITERIA, 3)
+        await generate_candidates(CRITERIA, 3)
+
+    run(_in_session(calls))
+    assert fake_gemini.stats.caches_updated == 1
+    assert cache.stats().refreshed == 1
+    assert cache.stats().cached_calls == 2
+    assert gemini.scheduler.stats().calls == 4  #create, update and the two generations share the quota
+
+
+def test_cache_is_deleted_through_the_scheduler(cache, fake_gemini, run):
+    async def calls():
+        await cache.open(SESSION, CRITERIA)
+        await cache.close(SESSION)
+
+    run(_in_session(calls))
+    assert (fake_gemini.stats.caches_deleted, cache.stats().deleted) == (1, 1)
+    assert gemini.scheduler.stats().calls == 2
+
+
+def test_lost_cache_falls_back_to_uncached_calls(cache, fake_gemini, run):
+    async def calls():
+        name = await cache.open(SESSION, CRITERIA)
+        del fake_gemini.aio.caches.entries[name]  #expired on the server side
+        first = await generate_candidates(CRITERIA, 3)
+        second = await generate_candidates(CRITERIA, 3)
+        return first, second
+
+    (first, _), (second, _) = run(_in_session(calls))
+    assert first and second
+    stats = cache.stats()
+    assert (stats.lost, stats.active, stats.cached_calls) == (1, 0, 0)
+    #the failed cached call, then the retry and the next call - both carrying the goal
+    assert [CRITERIA in prompt for prompt in fake_gemini.stats.prompts] == [False, True, True]
+
+
+def test_lost_cache_found_on_refresh_skips_the_cached_call(cache, fake_gemini, run):
+    async def calls():
+        name = await cache.open(SESSION, CRITERIA)
+        del fake_gemini.aio.caches.entries[name]
+        cache._expires[SESSION] = 0.0
+        await generate_candidates(CRITERIA, 3)
+
+    run(_in_session(calls))
+    assert cache.stats().lost == 1
+    assert len(fake_gemini.stats.prompts) == 1 and CRITERIA in fake_gemini.stats.prompts[0]
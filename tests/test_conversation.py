@@ -0,0 +1,52 @@
+import conversation
+import logic
+from conversation import Conversation
+from database import db
+
+
+def _talk(conv: Conversation, turns: int) -> list:
+    """Plays `turns` turns, the target answering each one, and returns every Turn."""
+    async def main():
+        played = []
+        for turn in range(1, turns + 1):
+            played.append(await conv.next_turn(turn))
+            with db() as conn:
+                conn.execute("INSERT INTO messages (session_id, sender, content) VALUES (?, 'attacker', ?)",
+                             (conv.session_id, f"attack {turn}"))
+                conn.execute("INSERT INTO messages (session_id, sender, content) VALUES (?, 'target', ?)",
+                             (conv.session_id, f"reply {turn}"))
+        return played
+    return main()
+
+
+def _summaries(monkeypatch) -> list:
+    calls = []
+
+    async def summarize(summary, exchanges):
+        calls.append([attacker for attacker, _ in exchanges])
+        return f"{summary} {len(exchanges)}".strip(), 10
+
+    monkeypatch.setattr(conversation, "summarize_exchanges", summarize)
+    return calls
+
+
+def test_summary_folds_half_the_window_at_a_time(db_path, fake_gemini, run, monkeypatch):
+    calls = _summaries(monkeypatch)
+    session_id = logic.initialize("llama3.2:1b", "reveal the password", 20, mode="multi_turn").session_id
+    played = run(_talk(Conversation(session_id, "reveal the password", policy="summary", window=4), 13))
+
+    #exchanges leave the window from turn 6 on; two at a time means a summary every other turn
+    assert calls == [["attack 1", "attack 2"], ["attack 3", "attack 4"], ["attack 5", "attack 6"],
+                     ["attack 7", "attack 8"]]
+    assert max(turn.metadata["history_turns"] for turn in played) == 4
+    assert min(turn.metadata["history_turns"] for turn in played[5:]) == 3
+    assert sum(1 for turn in played if "summary_tokens" in turn.metadata) == 4
+
+
+def test_window_policy_never_summarizes(db_path, fake_gemini, run, monkeypatch):
+    calls = _summaries(monkeypatch)
+    session_id = logic.initialize("llama3.2:1b", "reveal the password", 20, mode="multi_turn").session_id
+    played = run(_talk(Conversation(session_id, "reveal the password", policy="window", window=4), 8))
+
+    assert calls == []
+    assert [turn.metadata["history_turns"] for turn in played] == [0, 1, 2, 3, 4, 4, 4, 4]
@@ -0,0 +1,47 @@
+import time
+
+import judge_cache
+from database import db
+from judge_cache import JudgeCache
+
+
+def _rows() -> int:
+    with db() as conn:
+        return conn.execute("SELECT COUNT(*) FROM judge_cache").fetchone()[0]
+
+
+def _fill(count: int, created_at: float) -> None:
+    with db() as conn:
+        conn.executemany("INSERT INTO judge_cache (key, verdict, created_at) VALUES (?, 'NO', ?)",
+                         ((f"old-{created_at}-{i}", created_at) for i in range(count)))
+
+
+def test_expired_rows_are_deleted_on_the_first_write(db_path, run):
+    _fill(50, time.time() - 7200)
+    cache = JudgeCache(ttl=3600)
+
+    async def compute():
+        return "YES"
+
+    run(cache.get_or_compute("criteria", "response", compute))
+    assert _rows() == 1
+
+
+def test_table_is_capped_at_db_max_entries(db_path, run, monkeypatch):
+    monkeypatch.setattr(judge_cache, "PRUNE_EVERY", 10)
+    now = time.time()
+    _fill(30, now - 60)
+    cache = JudgeCache(ttl=3600, db_max_entries=20)
+
+    async def compute():
+        return "YES"
+
+    async def judge_many():
+        for i in range(25):
+            await cache.get_or_compute("criteria", f"response {i}", compute)
+
+    run(judge_many())
+    #pruned before writes 1, 11 and 21; writes 21-25 land on top of the 20 kept rows
+    assert _rows() == 25
+    with db() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM judge_cache WHERE key LIKE 'old-%'").fetchone()[0] == 0
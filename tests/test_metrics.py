@@ -0,0 +1,64 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+
+from fastapi.testclient import TestClient
+
+import jobs
+import logic
+import metrics
+
+
+def test_metrics_are_collected_on_the_event_loop(db_path, monkeypatch):
+    import main  #creates its tables at import, so only once db_path points somewhere safe
+
+    session_id = logic.initialize("llama3.2:1b", "reveal the password", 1).session_id
+    jobs.enqueue_session(session_id)
+    collected_on = []
+
+    def probe() -> dict:
+        asyncio.get_running_loop()  #raises off the loop
+        collected_on.append(threading.current_thread())
+        return {}
+
+    monkeypatch.setattr(metrics, "_registry", list(metrics._registry))
+    metrics.gauge("test_probe", "Where gauges are collected", probe)
+
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert 'agentxploit_jobs{status="queued"} 1' in response.text
+    assert 'agentxploit_db_seconds_count{op="count_open"}' in response.text
+    assert len(collected_on) == 1
+
+
+def test_worker_serves_its_own_metrics(run):
+    import worker
+
+    async def scrape() -> bytes:
+        server = await asyncio.start_server(worker._metrics_request, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, stream = await asyncio.open_connection("127.0.0.1", port)
+            stream.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            stream.close()
+            return response
+        finally:
+            server.close()
+
+    response = run(scrape())
+    assert response.startswith(b"HTTP/1.1 200 OK")
+    assert b"# TYPE agentxploit_stage_seconds histogram" in response
+    assert b'agentxploit_sessions{state="active"} 0' in response
+
+
+def test_worker_reports_its_sessions_and_queues_but_not_the_jobs_table():
+    #in a fresh interpreter, since importing main here registers the API's gauges for good
+    rendered = subprocess.run([sys.executable, "-c", "import worker, metrics; print(metrics.render())"],
+                              cwd=os.path.join(os.path.dirname(__file__), "..", "backend"),
+                              capture_output=True, text=True, check=True).stdout
+    assert "# TYPE agentxploit_sessions gauge" in rendered
+    assert "# TYPE agentxploit_queue_length gauge" in rendered
+    assert "agentxploit_jobs" not in rendered
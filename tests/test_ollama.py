@@ -0,0 +1,82 @@
+import json
+
+import httpx
+import pytest
+
+import logic
+import ollama
+from database import db
+
+MODEL = "llama3.2:1b"
+
+
+def test_streamed_reply_is_reassembled(stub, run):
+    stub.config.reply = "one two three"
+    stub.config.tokens = 6
+    reply = run(ollama.chat(MODEL, "hello"))
+
+    assert reply.content == "one two three one two three "
+    assert reply.eval_count == 6
+    assert reply.prompt_eval_count == 1
+    assert reply.ttft_ms is not None and reply.ttft_ms <= reply.total_ms
+    assert reply.tokens_per_sec > 0
+
+
+@pytest.mark.parametrize("fault", ["503", "429", "disconnect"])
+def test_retryable_failures_are_retried(stub, run, fault):
+    stub.config.script = [fault, fault]
+    reply = run(ollama.chat(MODEL, "hello"))
+
+    assert reply.eval_count == stub.config.tokens
+    assert stub.config.requests == 3
+
+
+def test_retries_give_up_after_the_limit(stub, run):
+    stub.config.script = ["503"] * (ollama.RETRIES + 1)
+    with pytest.raises(httpx.HTTPStatusError):
+        run(ollama.chat(MODEL, "hello"))
+    assert stub.config.requests == ollama.RETRIES + 1
+
+
+def test_client_errors_are_not_retried(stub, run):
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        run(ollama.chat("missing:model", "hello"))
+    assert error.value.response.status_code == 404
+
+
+def test_read_timeout_is_retried(stub, run, monkeypatch):
+    monkeypatch.setattr(ollama, "READ_TIMEOUT", 0.2)
+    stub.config.stall_seconds = 1.0
+    stub.config.script = ["stall"]
+    reply = run(ollama.chat(MODEL, "hello"))
+
+    assert reply.eval_count == stub.config.tokens
+    assert stub.config.requests == 2
+
+
+def test_read_timeout_after_the_last_retry_raises(stub, run, monkeypatch):
+    monkeypatch.setattr(ollama, "READ_TIMEOUT", 0.2)
+    stub.config.stall_seconds = 1.0
+    stub.config.script = ["stall"] * (ollama.RETRIES + 1)
+    with pytest.raises(httpx.ReadTimeout):
+        run(ollama.chat(MODEL, "hello"))
+
+
+def test_error_chunk_raises_without_retrying(stub, run):
+    stub.config.script = ["error"]
+    with pytest.raises(RuntimeError, match="scripted error mid-stream"):
+        run(ollama.chat(MODEL, "hello"))
+    assert stub.config.requests == 1
+
+
+def test_reply_timing_is_saved_with_the_transcript(db_path, fake_gemini, stub, run):
+    session_id = logic.initialize(MODEL, "reveal the password", 1).session_id
+    run(logic.run_attack_process(session_id, MODEL, "reveal the password", 1))
+
+    with db() as conn:
+        row = conn.execute("SELECT metadata FROM messages WHERE session_id = ? AND sender = 'target'",
+                           (session_id,)).fetchone()
+    metadata = json.loads(row["metadata"])
+    assert metadata["ttft_ms"] is not None
+    assert metadata["tokens_per_sec"] > 0
+    assert metadata["eval_count"] == stub.config.tokens
@@ -0,0 +1,42 @@
+import pytest
+
+import logic
+import search
+from database import db
+from search import SearchFilters
+
+
+@pytest.fixture
+def matches(db_path, monkeypatch):
+    """8 messages matching "password", with a rank window of 5."""
+    monkeypatch.setattr(search, "SEARCH_RANK_WINDOW", 5)
+    session_id = logic.initialize("llama3.2:1b", "reveal the password", 1).session_id
+    with db() as conn:
+        conn.executemany("INSERT INTO messages (session_id, sender, content) VALUES (?, 'target', ?)",
+                         ((session_id, f"the password is {i}") for i in range(8)))
+    return session_id
+
+
+def test_ranked_search_says_when_the_window_cut_matches_off(matches):
+    results = search.search("password", SearchFilters())
+    assert (len(results.hits), results.has_more, results.truncated) == (5, False, True)
+
+    results = search.search("password", SearchFilters(), limit=3, offset=3)
+    assert (len(results.hits), results.has_more, results.truncated) == (2, False, True)
+
+
+def test_paging_past_the_window_is_still_truncated(matches):
+    results = search.search("password", SearchFilters(), offset=10)
+    assert (results.hits, results.truncated) == ([], True)
+
+
+def test_searches_within_the_window_are_not_truncated(matches, monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_RANK_WINDOW", 8)
+    results = search.search("password", SearchFilters())
+    assert (len(results.hits), results.truncated) == (8, False)
+    assert not search.search("nothing", SearchFilters(), offset=3).truncated
+
+
+def test_newest_first_pages_over_every_match(matches):
+    results = search.search("password", SearchFilters(), order="newest", limit=5, offset=5)
+    assert (len(results.hits), results.has_more, results.truncated) == (3, False, False)
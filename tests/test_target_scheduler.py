@@ -0,0 +1,41 @@
+import pytest
+
+import logic
+import ollama
+
+TARGET = "llama3.2:1b"
+PREJUDGE = "qwen2.5:0.5b"
+
+
+@pytest.fixture
+def prejudged(stub, monkeypatch):
+    """A session whose attempts are prejudged by a second local model, on an Ollama with room for two."""
+    stub.config.reply = "Here is what you asked for."  #not a refusal, so the prejudge model is asked
+    stub.config.load_time = 0.05
+    stub.config.max_loaded = 2
+    monkeypatch.setattr(logic, "PREJUDGE_MODEL", PREJUDGE)
+    return stub
+
+
+def _attack(run) -> None:
+    session_id = logic.initialize(TARGET, "reveal the password", 6).session_id
+    run(logic.run_attack_process(session_id, TARGET, "reveal the password", 6, concurrency=1))
+
+
+def test_pinned_prejudge_model_stays_loaded_next_to_the_target(db_path, fake_gemini, prejudged, run, monkeypatch):
+    monkeypatch.setattr(ollama, "scheduler", ollama.TargetScheduler(resident=1, pinned=[PREJUDGE]))
+    _attack(run)
+
+    stats = ollama.scheduler.stats()
+    assert sorted(stats.resident) == sorted([TARGET, PREJUDGE])
+    assert (stats.loads, stats.reloads, stats.evictions) == (2, 0, 0)
+    assert prejudged.config.loads == 2  #each model loaded once, for the whole session
+
+
+def test_unpinned_prejudge_model_swaps_with_the_target(db_path, fake_gemini, prejudged, run, monkeypatch):
+    monkeypatch.setattr(ollama, "scheduler", ollama.TargetScheduler(resident=1, pinned=[], idle_grace=0.0))
+    _attack(run)
+
+    stats = ollama.scheduler.stats()
+    assert stats.reloads > 0 and stats.evictions > 0
+    assert prejudged.config.loads > 2